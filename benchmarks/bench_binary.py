@@ -0,0 +1,65 @@
+'''Compare startup time from a binary snapshot against parsing YAML or JSON.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_binary.py`.
+'''
+from __future__ import print_function
+import json
+import os
+import tempfile
+import timeit
+
+from vertigo import from_dict, freeze
+from vertigo.binary import dump_binary, load_binary
+from vertigo.load_json import load_json_graph
+from vertigo.load_yaml import load_graph
+import yaml
+
+
+def config(services, settings):
+    return dict(('service{}'.format(i), dict(
+        _self=i,
+        endpoints=['a.example.com', 'b.example.com'],
+        **dict(('setting{}'.format(j), dict(value=j, enabled=True))
+            for j in range(settings))
+    )) for i in range(services))
+
+
+def timed(fn, number=3):
+    return min(timeit.repeat(fn, number=1, repeat=number))
+
+
+if __name__ == '__main__':
+    data = config(5000, 20)
+    graph = from_dict(data)
+    tmp = tempfile.mkdtemp()
+    paths = dict((ext, os.path.join(tmp, 'config.' + ext))
+        for ext in ('yaml', 'json', 'vg'))
+    with open(paths['yaml'], 'w') as f:
+        yaml.safe_dump(data, f)
+    with open(paths['json'], 'w') as f:
+        json.dump(data, f)
+    dump_binary(graph, paths['vg'])
+    path = ('service4321', 'setting7', 'value')
+
+    def yaml_load():
+        with open(paths['yaml']) as f:
+            return load_graph(f)[path].value
+    def json_load():
+        with open(paths['json']) as f:
+            return load_json_graph(f)[path].value
+    def binary_load():
+        return load_binary(paths['vg'])[path].value
+
+    print('graph with {} nodes'.format(len(freeze(graph)._store.values)))
+    for name, ext, fn in (('yaml (libyaml)', 'yaml', yaml_load),
+            ('json', 'json', json_load), ('binary snapshot', 'vg', binary_load)):
+        size = os.path.getsize(paths[ext])
+        print('{:<16} {:>6} KB  load + one lookup: {:.4f}s'.format(
+            name, size // 1024, timed(fn)))
+    g = load_binary(paths['vg'])
+    print('binary snapshot full traversal: {:.3f}s'.format(
+        timed(lambda: g.all_equals(graph))))
+    del g
+    for path in paths.values():
+        os.remove(path)
+    os.rmdir(tmp)
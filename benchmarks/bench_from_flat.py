@@ -0,0 +1,50 @@
+'''Compare the trie-based from_flat against the old per-key graph descent.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_from_flat.py`.
+'''
+from __future__ import print_function
+import timeit
+
+from vertigo import PlainGraphNode, from_flat
+
+
+def old_from_flat(d, cls=PlainGraphNode, sep='/'):
+    '''The original implementation, kept here for comparison.'''
+    root = cls()
+    for key, val in d.items():
+        if sep and not isinstance(key, (list, tuple)):
+            path = [bit for bit in key.split(sep) if bit]
+        else:
+            path = key
+        target = root
+        for bit in path:
+            if bit not in target:
+                new_node = PlainGraphNode()
+                target.add_edge(bit, new_node)
+            target = target[bit]
+        if target.value:
+            raise ValueError("Duplicate path '{}'".format(sep.join(path)))
+        target.value = val
+    return root
+
+
+def flat_keys(width, depth):
+    '''Every leaf path of a tree with the given fanout and depth.'''
+    paths = ['']
+    for _ in range(depth):
+        paths = [p + '/k' + str(i) for p in paths for i in range(width)]
+    return dict((p, i) for i, p in enumerate(paths))
+
+
+def bench(name, d, number=1):
+    results = []
+    for fn in (old_from_flat, from_flat):
+        t = min(timeit.repeat(lambda: fn(d), number=number, repeat=3))
+        results.append('{:>9.0f} keys/s'.format(len(d) * number / t))
+    print('{:<34} old: {}   trie: {}'.format(name, *results))
+
+
+if __name__ == '__main__':
+    bench('10^5 keys, fanout 10, depth 5', flat_keys(10, 5))
+    bench('~2.6*10^5 keys, fanout 4, depth 9', flat_keys(4, 9))
+    bench('10^5 keys, fanout 10^5, depth 1', flat_keys(100000, 1))
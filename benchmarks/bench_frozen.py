@@ -0,0 +1,47 @@
+'''Compare memory use and traversal speed of FrozenGraph and PlainGraphNode.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_frozen.py`.
+'''
+from __future__ import print_function
+import gc
+import time
+import tracemalloc
+
+from vertigo import PlainGraphNode, freeze, iter_events
+
+
+KEYS = ['name', 'enabled', 'timeout', 'retries', 'host', 'port']
+
+def build(width, depth):
+    if depth == 0:
+        return PlainGraphNode(12)
+    return PlainGraphNode(depth, [(KEYS[i % len(KEYS)] + str(i // len(KEYS)),
+        build(width, depth-1)) for i in range(width)])
+
+
+def measure(make):
+    gc.collect()
+    tracemalloc.start()
+    obj = make()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def traverse(graph):
+    start = time.time()
+    n = sum(1 for _ in iter_events(graph))
+    return n // 2, time.time() - start
+
+
+if __name__ == '__main__':
+    for width, depth in [(10, 5), (100, 3)]:
+        plain, plain_size = measure(lambda: build(width, depth))
+        frozen, frozen_size = measure(lambda: freeze(plain))
+        n, plain_time = traverse(plain)
+        _, frozen_time = traverse(frozen)
+        print('{} nodes (fanout {}, depth {})'.format(n, width, depth))
+        print('  PlainGraphNode: {:>8.1f} MB  walk {:.3f}s'.format(
+            plain_size / 1e6, plain_time))
+        print('  FrozenGraph:    {:>8.1f} MB  walk {:.3f}s'.format(
+            frozen_size / 1e6, frozen_time))
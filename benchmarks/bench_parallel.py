@@ -0,0 +1,56 @@
+'''Compare Walker.parallel_walk against Walker.walk on a wide graph.
+
+The visitor does a fixed amount of hashing per node to stand in for real
+per-node work like validation or rendering. Speedup from the process pool
+depends on the number of cores; thread pools only help when the visitor
+releases the GIL.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_parallel.py`.
+'''
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
+import multiprocessing
+import time
+
+from vertigo import PlainGraphNode, Walker
+
+from common import wide
+
+
+def digest(value, path, children, _pre):
+    h = hashlib.sha256(repr(value).encode('utf8'))
+    for _ in range(200):
+        h = hashlib.sha256(h.digest())
+    for child in children.values():
+        h.update(child.encode('ascii'))
+    return h.hexdigest()
+
+
+def build(fanout, subtree_width, subtree_depth):
+    return PlainGraphNode('root', [(str(i), wide(subtree_width,
+        subtree_depth, leaf='leaf')) for i in range(fanout)])
+
+
+def timed(fn):
+    start = time.time()
+    result = fn()
+    return result, time.time() - start
+
+
+if __name__ == '__main__':
+    ncpu = multiprocessing.cpu_count()
+    graph = build(fanout=64, subtree_width=8, subtree_depth=3)
+    w = Walker(post_children=digest)
+    expected, base = timed(lambda: w.walk(graph))
+    print('cpus: {}'.format(ncpu))
+    print('{:<32} {:.3f}s'.format('walk', base))
+    for name, executor_cls in [('threads', ThreadPoolExecutor),
+            ('processes', ProcessPoolExecutor)]:
+        for split_depth in (1, 2):
+            with executor_cls(ncpu) as executor:
+                result, t = timed(lambda: w.parallel_walk(graph, executor,
+                    split_depth=split_depth))
+            assert result == expected
+            label = 'parallel_walk ({}, depth {})'.format(name, split_depth)
+            print('{:<32} {:.3f}s  ({:.2f}x)'.format(label, t, base / t))
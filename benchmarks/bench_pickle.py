@@ -0,0 +1,43 @@
+'''Compare flat-table pickling of graphs against the default slot pickling.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_pickle.py`.
+'''
+from __future__ import print_function
+import pickle
+import timeit
+
+from vertigo import PlainGraphNode
+
+from common import wide, deep
+
+
+# The flat-table __reduce__, to restore after measuring the default one
+_flat_reduce = PlainGraphNode.__dict__['__reduce__']
+
+
+def measure(graph, number=3):
+    proto = pickle.HIGHEST_PROTOCOL
+    try:
+        data = pickle.dumps(graph, proto)
+    except RecursionError:
+        return 'RecursionError'
+    dump = min(timeit.repeat(lambda: pickle.dumps(graph, proto),
+        number=1, repeat=number))
+    load = min(timeit.repeat(lambda: pickle.loads(data), number=1, repeat=number))
+    return 'dump {:.3f}s load {:.3f}s {:>6} KB'.format(dump, load, len(data) // 1024)
+
+
+def bench(name, graph):
+    flat = measure(graph)
+    PlainGraphNode.__reduce__ = object.__reduce__
+    try:
+        default = measure(graph)
+    finally:
+        PlainGraphNode.__reduce__ = _flat_reduce
+    print('{:<26} default: {:<36} flat: {}'.format(name, default, flat))
+
+
+if __name__ == '__main__':
+    bench('wide (10^5 nodes)', wide(10, 5))
+    bench('wide (10^6 nodes)', wide(10, 6))
+    bench('deep (depth 10^4)', deep(10000))
@@ -0,0 +1,35 @@
+'''Compare chained eager operations against one materialized pipeline.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_pipeline.py`.
+'''
+from __future__ import print_function
+import timeit
+
+from vertigo import pipeline, overlay, fill_nones, map
+from vertigo.wrappers import EdgeRestriction
+
+from common import wide
+
+
+def eager(graph, defaults, keys):
+    graph = fill_nones(graph, 0)
+    graph = map(graph, lambda v: v + 1)
+    graph = map(graph, lambda v: v * 2)
+    graph = overlay(graph, defaults, merge_fn='union')
+    return EdgeRestriction(graph, keys)
+
+
+def piped(graph, defaults, keys):
+    return (pipeline(graph).fill_nones(0).map(lambda v: v + 1)
+        .map(lambda v: v * 2).overlay(defaults, merge_fn='union')
+        .restrict(keys).materialize())
+
+
+if __name__ == '__main__':
+    graph = wide(10, 5, leaf=None)
+    defaults = wide(10, 3, leaf=None)
+    for keys in ([str(i) for i in range(10)], ['0']):
+        times = [min(timeit.repeat(lambda: fn(graph, defaults, keys),
+            number=1, repeat=3)) for fn in (eager, piped)]
+        print('10^5 nodes, keeping {:>2} of 10 root edges: eager {:.3f}s  '
+            'pipeline {:.3f}s'.format(len(keys), *times))
@@ -0,0 +1,46 @@
+'''Compare the lockstep replace() against the old root-lookup-per-node one.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_replace.py`.
+'''
+from __future__ import print_function
+import timeit
+
+from vertigo import PlainGraphNode, replace, make_path_graph
+from vertigo.graph import Missing
+from vertigo.walker import bottom_up
+
+from common import wide, deep
+
+
+@bottom_up(memoize=False)
+def old_replace(_value, path, children, _pre, source_graph,
+    default_value=Missing, cls=PlainGraphNode):
+    '''The original implementation, kept here for comparison.'''
+    try:
+        value = source_graph[path].value
+    except KeyError:
+        if default_value is Missing:
+            raise
+        value = default_value
+    return cls(value=value, edges=children)
+
+
+def bench(name, graph, source, number=3, **kwargs):
+    results = []
+    for fn in (old_replace, replace):
+        t = min(timeit.repeat(lambda: fn(graph, source, **kwargs),
+            number=number, repeat=3))
+        results.append('{:.4f}s'.format(t / number))
+    print('{:<36} old: {:<10} lockstep: {}'.format(name, *results))
+
+
+if __name__ == '__main__':
+    g = wide(10, 4)
+    bench('wide (10^4 nodes, fanout 10)', g, make_path_graph(g))
+    bench('wide, half missing (default)', g,
+        PlainGraphNode(0, [(str(i), g[str(i)]) for i in range(5)]),
+        default_value=None)
+    g = deep(500)
+    bench('deep (depth 500)', g, make_path_graph(g))
+    g = deep(2000)
+    bench('deep (depth 2000)', g, make_path_graph(g), number=1)
@@ -0,0 +1,54 @@
+'''Compare worker memory and startup for shared-memory graphs vs unpickling.
+
+Each worker either attaches to a graph published with publish_shared() or
+unpickles its own copy, then reads every value. The private memory each worker
+adds is read from /proc/self/smaps_rollup, so this only reports memory on Linux.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_shared.py`.
+'''
+from __future__ import print_function
+import multiprocessing
+import pickle
+import time
+
+from vertigo.binary import publish_shared, attach_shared
+
+from common import wide, traverse
+
+
+def private_kb():
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            return sum(int(line.split()[1]) for line in f
+                if line.startswith(('Private_Clean', 'Private_Dirty')))
+    except IOError:
+        return float('nan')
+
+
+def worker(how, arg):
+    before = private_kb()
+    start = time.time()
+    graph = attach_shared(arg) if how == 'shared' else pickle.loads(arg)
+    startup = time.time() - start
+    traverse(graph)
+    return startup, private_kb() - before
+
+
+if __name__ == '__main__':
+    graph = wide(10, 5, leaf='leaf value', prefix='key')
+    data = pickle.dumps(graph, pickle.HIGHEST_PROTOCOL)
+    shm = publish_shared(graph)
+    del graph
+    ctx = multiprocessing.get_context('fork')
+    try:
+        for how, arg in (('pickle', data), ('shared', shm.name)):
+            with ctx.Pool(4) as pool:
+                results = pool.starmap(worker, [(how, arg)] * 4)
+            startup = max(r[0] for r in results)
+            memory = sum(r[1] for r in results)
+            print('{:<7} startup per worker: {:.4f}s  private memory for 4 workers: {} KB'
+                .format(how, startup, memory))
+        print('shared block: {} KB'.format(shm.size // 1024))
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,47 @@
+'''Compare vmap() against map() on graphs of numeric values.
+
+Pass graph sizes on the command line to override the defaults, e.g.
+`PYTHONPATH=. python benchmarks/bench_vmap.py 100000 1000000 10000000`.
+'''
+from __future__ import print_function
+import math
+import sys
+import time
+
+from vertigo import PlainGraphNode, map, vmap, freeze
+from vertigo.misc_fns import numpy
+
+
+def build(n, fanout=10):
+    # A complete tree with roughly n nodes
+    depth = max(1, int(round(math.log(n * (fanout - 1) + 1, fanout))) - 1)
+    def sub(d, i):
+        if d == 0:
+            return PlainGraphNode(float(i))
+        return PlainGraphNode(float(i), [(str(k), sub(d-1, i*fanout+k))
+            for k in range(fanout)])
+    return sub(depth, 1)
+
+
+def timed(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10**5, 10**6]
+    if numpy is None:
+        print('NumPy not installed; vmap falls back to per-value calls')
+        vector_fn = scalar_fn = lambda x: x * 2.0 + 1.0
+    else:
+        vector_fn = lambda a: numpy.sqrt(a) * 2.0 + 1.0
+        scalar_fn = lambda x: math.sqrt(x) * 2.0 + 1.0
+    for n in sizes:
+        g = build(n)
+        f = freeze(g)
+        t_map = timed(lambda: map(g, scalar_fn))
+        t_vmap = timed(lambda: vmap(g, vector_fn))
+        t_frozen = timed(lambda: vmap(f, vector_fn))
+        print('{:>9} nodes: map {:.3f}s  vmap {:.3f}s  vmap(frozen) {:.3f}s'
+            .format(len(f._store.values), t_map, t_vmap, t_frozen))
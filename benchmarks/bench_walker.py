@@ -0,0 +1,44 @@
+'''Compare the iterative Walker engine against the old recursive one.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_walker.py`.
+'''
+from __future__ import print_function
+from collections import OrderedDict
+import timeit
+
+from vertigo import Walker
+
+from common import wide, deep
+
+
+class RecursiveWalker(Walker):
+    '''The original recursive engine, kept here for comparison.'''
+    def _walk(self, node, path, args, kwargs):
+        pre_result = self.visit_pre_children(node.value, path, *args, **kwargs)
+        children = OrderedDict()
+        for key, child in node.edge_iter():
+            children[key] = self._walk(child, path+(key,), args, kwargs)
+        return self.visit_post_children(node.value, path, children, pre_result, *args, **kwargs)
+
+
+def count(value, path, children, _pre):
+    return 1 + sum(children.values())
+
+
+def bench(name, graph, number=5):
+    results = []
+    for walker_cls in (RecursiveWalker, Walker):
+        w = walker_cls(post_children=count)
+        try:
+            t = min(timeit.repeat(lambda: w.walk(graph), number=number, repeat=3))
+            results.append('{:.4f}s'.format(t / number))
+        except RuntimeError: # RecursionError
+            results.append('RecursionError')
+    print('{:<28} recursive: {:<16} iterative: {}'.format(name, *results))
+
+
+if __name__ == '__main__':
+    bench('wide (10^5 nodes, fanout 10)', wide(10, 5))
+    bench('wide (fanout 1000, depth 2)', wide(1000, 2))
+    bench('deep (depth 900)', deep(900))
+    bench('deep (depth 10^4)', deep(10000), number=1)
@@ -0,0 +1,37 @@
+'''Compare load_graph with the libyaml loader against the pure-Python one.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_yaml.py`.
+'''
+from __future__ import print_function
+import timeit
+
+from vertigo.load_yaml import load_graph, VertigoYAMLLoader, VertigoYAMLCLoader
+
+
+def config(services, settings):
+    '''A config file with one block of settings per service.'''
+    lines = []
+    for i in range(services):
+        lines.append('service{}:'.format(i))
+        lines.append('    _self: {}'.format(i))
+        lines.append('    endpoints: [a.example.com, b.example.com]')
+        for j in range(settings):
+            lines.append('    setting{}: {{value: {}, enabled: true}}'.format(j, j))
+    return '\n'.join(lines)
+
+
+def bench(name, text, number=1):
+    results = []
+    for loader in (VertigoYAMLLoader, VertigoYAMLCLoader):
+        t = min(timeit.repeat(lambda: load_graph(text, Loader=loader),
+            number=number, repeat=3))
+        results.append('{:.3f}s'.format(t / number))
+    print('{:<30} python: {:<9} libyaml: {}'.format(name, *results))
+
+
+if __name__ == '__main__':
+    if VertigoYAMLCLoader is None:
+        raise SystemExit('PyYAML was built without libyaml')
+    for services, settings in ((100, 10), (1000, 20), (5000, 20)):
+        text = config(services, settings)
+        bench('{} services ({} KB)'.format(services, len(text) // 1024), text)
@@ -0,0 +1,64 @@
+'''Compare the set-based zip merge functions against the old generator ones.
+
+Run from the repository root with `PYTHONPATH=. python benchmarks/bench_zip.py`.
+'''
+from __future__ import print_function
+import itertools
+import timeit
+
+from vertigo import PlainGraphNode, plain_copy
+from vertigo.zip_fns import izip, StructureMismatch
+
+
+def _non_none(graphs):
+    return [n for n in graphs if n is not None]
+
+def old_union(graphs):
+    keys = itertools.chain(*[g.key_iter() for g in _non_none(graphs)])
+    used = set()
+    for key in keys:
+        if key not in used:
+            used.add(key)
+            yield key
+
+def old_intersection(graphs):
+    graphs = _non_none(graphs)
+    for key in old_union(graphs):
+        for graph in graphs:
+            if key not in graph:
+                break
+        else:
+            yield key
+
+def old_strict(graphs):
+    return list(_old_strict(graphs))
+
+def _old_strict(graphs):
+    for key in old_union(graphs):
+        for graph in graphs:
+            if key not in graph:
+                raise StructureMismatch(key)
+        else:
+            yield key
+
+
+def wide(width, offset):
+    return PlainGraphNode(0, [(str(i + offset), PlainGraphNode(i))
+        for i in range(width)])
+
+
+def bench(name, graphs, old, new, number=3):
+    times = [min(timeit.repeat(lambda: plain_copy(izip(*graphs, merge_fn=fn)),
+        number=number, repeat=3)) / number for fn in (old, new)]
+    print('{:<44} old: {:.4f}s  new: {:.4f}s'.format(name, *times))
+
+
+if __name__ == '__main__':
+    width = 20000
+    overlapping = [wide(width, i * width // 2) for i in range(4)]
+    same = [wide(width, 0) for _ in range(4)]
+    bench('union, 4 graphs x 2*10^4 children', overlapping, old_union, 'union')
+    bench('intersection, 4 graphs x 2*10^4 children', overlapping,
+        old_intersection, 'intersection')
+    bench('intersection, identical keys', same, old_intersection, 'intersection')
+    bench('strict, identical keys', same, old_strict, 'strict')
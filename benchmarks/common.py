@@ -0,0 +1,35 @@
+'''Graph builders and helpers shared by the benchmark scripts.
+
+The scripts are run as `PYTHONPATH=. python benchmarks/bench_*.py`, which puts
+this directory on the path, so they import this as `common`.
+'''
+from vertigo import PlainGraphNode
+
+
+def wide(width, depth, leaf=0, prefix=''):
+    '''A complete tree: width children per node, depth levels below the root.
+
+    Interior nodes hold their height, leaves hold leaf, and the edges are
+    labelled prefix + '0', prefix + '1', etc.
+    '''
+    if depth == 0:
+        return PlainGraphNode(leaf)
+    return PlainGraphNode(depth, [(prefix + str(i),
+        wide(width, depth-1, leaf, prefix)) for i in range(width)])
+
+
+def deep(depth):
+    '''A chain of depth nodes below the root, each with the single edge 'child'.'''
+    g = PlainGraphNode(0)
+    for i in range(depth):
+        g = PlainGraphNode(i, child=g)
+    return g
+
+
+def traverse(graph):
+    '''Read every value in graph, without recursing.'''
+    stack = [graph]
+    while stack:
+        node = stack.pop()
+        node.value
+        stack.extend(node.child_iter())
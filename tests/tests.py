@@ -249,3 +249,861 @@ def test_empty_zip():
     assert vgz.izip(PlainGraphNode(), merge_fn='first').all_equals(PlainGraphNode((None,)))
     assert vgz.izip(PlainGraphNode(), merge_fn='last').all_equals(PlainGraphNode((None,)))
 
+
+def test_unzip_shared_nodes():
+    shared = PlainGraphNode((1, 2), x=PlainGraphNode((3, 4)))
+    g = PlainGraphNode((0, 0), a=shared, b=shared)
+    t1, t2 = vgz.unzip(g)
+    assert t1['a'] is t1['b']
+    assert t2['a', 'x'] is t2['b', 'x']
+    assert t2['b', 'x'].value == 4
+    # Zipped views build fresh children, so they aren't memoized
+    u1, u2 = vgz.unzip(vgz.izip(g, g))
+    assert u1['a'] is not u1['b']
+    assert u2.all_equals(g)
+
+def _count_nodes(value, path, children, _pre):
+    return 1 + sum(children.values())
+
+def _sum_values(value, path, children, _pre):
+    if callable(value):
+        value = value()
+    return value + sum(children.values())
+
+def test_parallel_walk():
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    from vertigo.walker import Walker, Stop
+    g = PlainGraphNode(1, [(str(i), PlainGraphNode.build(d([
+        ('_self', i), ('a', i), ('b', d([('_self', i), ('c', i)]))])))
+        for i in range(8)])
+    w = Walker(post_children=_sum_values)
+    expected = w.walk(g)
+    with ThreadPoolExecutor(2) as ex:
+        assert w.parallel_walk(g, ex) == expected
+        assert w.parallel_walk(g, ex, split_depth=2) == expected
+        assert w.parallel_walk(g, ex, split_depth=5) == expected
+        # split_depth=0 hands the whole graph to one worker
+        assert w.parallel_walk(g, ex, split_depth=0) == expected
+        try:
+            w.parallel_walk(g, ex, split_depth=-1)
+        except ValueError:
+            pass
+        else:
+            assert False, "Negative split_depth should raise ValueError"
+        # Stop from the top of the graph and from inside a subtree
+        def stop_at(value, path, children, _pre):
+            if path == ('3',):
+                return Stop('stopped')
+            return _sum_values(value, path, children, _pre)
+        assert Walker(post_children=stop_at).parallel_walk(g, ex) == 'stopped'
+        assert Walker(post_children=stop_at).parallel_walk(g, ex,
+            split_depth=2) == 'stopped'
+        assert Walker(post_children=stop_at).parallel_walk(g, ex,
+            split_depth=0) == 'stopped'
+    with ProcessPoolExecutor(2) as ex:
+        assert w.parallel_walk(g, ex) == expected
+        assert Walker(post_children=_count_nodes).parallel_walk(g, ex) == 33
+        # Unpicklable subtrees are walked in-process
+        g['5', 'a'].value = lambda: 5
+        assert w.parallel_walk(g, ex) == expected
+        # As is everything, if the walker itself can't be pickled
+        w2 = Walker(post_children=lambda *args: _sum_values(*args))
+        assert w2.parallel_walk(g, ex, split_depth=2) == expected
+        assert w.parallel_walk(g, ex, split_depth=0) == expected
+        assert w2.parallel_walk(g, ex, split_depth=0) == expected
+
+def test_frozen_graph():
+    from vertigo.graph import freeze, FrozenGraph
+    from vertigo.walker import iter_events
+    g = PlainGraphNode.build(d([
+        ('_self', 'root'),
+        ('a', d([('_self', 'A'), ('x', 1), ('y', 2)])),
+        ('b', d([('_self', 'B'), ('x', d([('z', 3)]))])),
+        ('c', None),
+    ]))
+    f = freeze(g)
+    assert isinstance(f, FrozenGraph)
+    assert f.all_equals(g) and g.all_equals(f)
+    assert list(iter_events(f)) == list(iter_events(g))
+    assert list(f['b'].key_iter()) == ['x']
+    assert f['b', 'x', 'z'].value == 3
+    assert ('a', 'z') not in f
+    assert 'c' in f and 'x' not in f
+    assert freeze(f) is f
+    assert plain_copy(f).all_equals(g)
+    # Keys are interned: each label is stored once
+    assert sorted(f._store.keys) == ['a', 'b', 'c', 'x', 'y', 'z']
+    assert freeze(PlainGraphNode(5)).all_equals(PlainGraphNode(5))
+    # Lookups search a per-node index by key id; edges keep their order
+    names = ['k{}'.format(i) for i in range(200, 0, -1)]
+    wide = freeze(PlainGraphNode(0, [(k, PlainGraphNode(k)) for k in names]))
+    assert list(wide.key_iter()) == names
+    assert all(wide[k].value == k for k in names)
+    assert 'k0' not in wide and 'x' not in wide
+
+def test_key_interning():
+    from vertigo.misc_fns import from_dict, from_flat
+    from vertigo.load_yaml import load_graph
+    def fresh(s):
+        # Build an equal string that isn't the same object as s
+        return ''.join(list(s))
+    assert fresh('timeout') is not fresh('timeout')
+    g1 = from_dict({fresh('timeout'): 1, 'sub': {fresh('timeout'): 2}})
+    g2 = PlainGraphNode.build({fresh('timeout'): 3})
+    g3 = from_flat({fresh('a/timeout'): 4})
+    g4 = plain_copy(map(g1, fn=lambda v: v))
+    g5 = load_graph('a: {timeout: 5}')
+    keys = [list(g1.key_iter())[0], list(g1['sub'].key_iter())[0],
+        list(g2.key_iter())[0], list(g3['a'].key_iter())[0],
+        list(g4['sub'].key_iter())[0], list(g5['a'].key_iter())[0]]
+    assert keys[0] == 'timeout'
+    assert all(k is keys[0] for k in keys)
+
+def test_vmap():
+    from vertigo.misc_fns import vmap, from_dict
+    from vertigo.graph import freeze, FrozenGraph
+    g = from_dict(d([('_self', 1), ('a', 2), ('b', d([('_self', 3), ('c', 4),
+        ('d', 5)])), ('e', 6)]))
+    double = lambda values: values * 2
+    expected = map(g, fn=lambda v: v * 2)
+    assert vmap(g, double).all_equals(expected)
+    f = freeze(g)
+    vf = vmap(f, double)
+    assert isinstance(vf, FrozenGraph)
+    assert vf._store.offsets is f._store.offsets
+    assert vf.all_equals(expected)
+    assert isinstance(vmap(f, double, cls=PlainGraphNode), PlainGraphNode)
+    assert vmap(PlainGraphNode(3), double).all_equals(PlainGraphNode(6))
+    # Only ints and floats are passed to fn; everything else is copied as is
+    mixed = from_dict(d([('a', 0), ('b', 'one'), ('c', True), ('d', 2.5)]))
+    vm = vmap(mixed, lambda values: values)
+    assert [vm[k].value for k in 'abcd'] == [0, 'one', True, 2.5]
+    assert type(vm['c'].value) is bool
+
+def test_vmap_numpy():
+    import vertigo.misc_fns as vgm
+    if vgm.numpy is None:
+        return
+    from vertigo.graph import freeze
+    g = vgm.from_flat({'a/x': 1.0, 'a/y': 4.0, 'b': 9.0, 'c': 'nine'})
+    calls = []
+    def root(values):
+        calls.append(values)
+        return vgm.numpy.sqrt(values)
+    r = vgm.vmap(g, root)
+    assert len(calls) == 1 and isinstance(calls[0], vgm.numpy.ndarray)
+    assert sorted(calls[0].tolist()) == [1.0, 4.0, 9.0]
+    assert r.value is None and r['a'].value is None
+    assert (r['a', 'x'].value, r['a', 'y'].value, r['b'].value) == (1.0, 2.0, 3.0)
+    assert r['c'].value == 'nine'
+    assert vgm.vmap(freeze(g), root).all_equals(r)
+    # Ints and floats get separate arrays, so ints stay ints
+    mixed = vgm.from_flat({'a': 1, 'b': 2.5, 'c': 3})
+    same = vgm.vmap(mixed, lambda values: values)
+    assert [(type(same[k].value), same[k].value) for k in 'abc'] == [
+        (int, 1), (float, 2.5), (int, 3)]
+    # Ints beyond int64 are applied one at a time, exactly where possible
+    huge = vgm.from_flat({'a': 4, 'b': 1 << 70, 'c': -(1 << 64) - 1})
+    assert vgm.vmap(huge, lambda values: values + 1).all_equals(
+        vgm.from_flat({'a': 5, 'b': (1 << 70) + 1, 'c': -(1 << 64)}))
+    r = vgm.vmap(huge, vgm.numpy.abs)
+    assert r['c'].value == (1 << 64) + 1
+    r = vgm.vmap(vgm.from_flat({'a': 4, 'b': 1 << 70}), vgm.numpy.sqrt)
+    assert (r['a'].value, r['b'].value) == (2.0, float(1 << 35))
+
+def test_persistent_graph():
+    from vertigo.graph import PersistentGraphNode as P
+    from vertigo.misc_fns import from_dict
+    g = from_dict(d([
+        ('a', d([('x', 1), ('y', 2)])),
+        ('b', d([('z', d([('deep', 3)]))])),
+    ]), cls=P)
+    assert isinstance(g['b', 'z'], P)
+    g2 = g.set_path(('b', 'z', 'deep'), P(4))
+    assert g['b', 'z', 'deep'].value == 3
+    assert g2['b', 'z', 'deep'].value == 4
+    assert g2['a'] is g['a']
+    assert g2['b'] is not g['b']
+    g3 = g2.set_path(('b', 'new'), P('new'))
+    assert list(g3['b'].key_iter()) == ['z', 'new']
+    assert g3['b', 'z'] is g2['b', 'z']
+    g4 = g3.pop_path(('a', 'x'))
+    assert list(g4['a'].key_iter()) == ['y']
+    assert list(g3['a'].key_iter()) == ['x', 'y']
+    assert g4['a', 'y'] is g['a', 'y']
+    g5 = g4.set_value((), 'root')
+    assert g5.value == 'root' and g4.value is None
+    assert g5['b'] is g4['b']
+    with expecting(KeyError):
+        g.set_path(('nope', 'x'), P())
+    with expecting(KeyError):
+        g.pop_path(('a', 'nope'))
+    with expecting(ValueError):
+        g.add_edge('a', P())
+    with expecting(ValueError):
+        g.set_path((), P())
+    with expecting(AttributeError):
+        g.value = 12
+    assert plain_copy(g5).all_equals(g5)
+
+def test_dedupe():
+    from vertigo.graph import HashConsBuilder, PersistentGraphNode
+    from vertigo.misc_fns import dedupe
+    from vertigo.load_yaml import load_graph
+    g = load_graph('''
+    host1: {port: 80, opts: {retries: 3}}
+    host2: {port: 80, opts: {retries: 3}}
+    host3: {port: 80.0, opts: {retries: 3}}
+    host4: {port: [80], opts: {retries: 3}}
+    ''', cls=HashConsBuilder(PersistentGraphNode))
+    assert isinstance(g, PersistentGraphNode)
+    assert g['host1'] is g['host2']
+    assert g['host1'] is not g['host3']
+    assert g['host1', 'opts'] is g['host4', 'opts']
+    assert g['host4', 'port'].value == [80]
+    # Values are told apart by type all the way down
+    hb = HashConsBuilder()
+    assert hb((1,), []) is hb((1,), [])
+    assert hb((1.0,), []).value == (1.0,)
+    assert type(hb([True], []).value[0]) is bool
+    assert hb(-0.0, []) is not hb(0.0, [])
+    assert hb({'a': [1]}, []) is hb({'a': [1]}, [])
+    # Values without an exact encoding are never shared
+    from decimal import Decimal
+    assert hb(Decimal(1), []) is not hb(Decimal(1), [])
+    # dedupe() visits shared input nodes once, so long chains of shared
+    # nodes stay fast
+    chain = PlainGraphNode('bottom')
+    for i in range(100):
+        chain = PlainGraphNode('link', a=chain, b=chain)
+    deduped = dedupe(chain)
+    assert deduped['a', 'b', 'a'] is deduped['b', 'a', 'b']
+    assert dedupe(PlainGraphNode(1, a=PlainGraphNode(2))).all_equals(
+        PlainGraphNode(1, a=PlainGraphNode(2)))
+
+def test_content_hash():
+    from vertigo.graph import freeze, PersistentGraphNode as P
+    from vertigo.misc_fns import from_dict
+    data = d([('_self', 0), ('a', d([('x', 1), ('y', [2])])), ('b', 3)])
+    g = from_dict(data)
+    f = freeze(g)
+    p = plain_copy(g, cls=P)
+    for ordered in (True, False):
+        h = g.content_hash(ordered)
+        assert f.content_hash(ordered) == h
+        assert p.content_hash(ordered) == h
+        assert f['a'].content_hash(ordered) == g['a'].content_hash(ordered)
+    # Order, keys and values all matter
+    swapped = from_dict(d([('_self', 0), ('b', 3), ('a', d([('x', 1), ('y', [2])]))]))
+    renamed = from_dict(d([('_self', 0), ('a', d([('x', 1), ('z', [2])])), ('b', 3)]))
+    changed = from_dict(d([('_self', 0), ('a', d([('x', 1), ('y', [2])])), ('b', 4)]))
+    assert swapped.content_hash() != g.content_hash()
+    assert swapped.content_hash(False) == g.content_hash(False)
+    assert renamed.content_hash() != g.content_hash()
+    assert changed.content_hash(False) != g.content_hash(False)
+    assert not g.all_equals(renamed)
+    # Immutable graphs cache their hashes, and equality checks use them
+    assert p['a']._cached_hash(True) == g['a'].content_hash()
+    assert f['b']._cached_hash(False) == g['b'].content_hash(False)
+    p2 = p.set_value('b', 4)
+    assert p2['a']._cached_hash(True) is not None
+    assert p2._cached_hash(True) is None
+    assert p2.content_hash() == changed.content_hash()
+    assert not p2.all_equals(p) and not p2.unordered_equals(p)
+    assert p2.set_value('b', 3).all_equals(p)
+    assert freeze(changed).all_equals(p2)
+    # Shared nodes are fine; cycles aren't
+    shared = PlainGraphNode(1)
+    assert PlainGraphNode(0, a=shared, b=shared).content_hash() == \
+        PlainGraphNode(0, a=PlainGraphNode(1), b=PlainGraphNode(1)).content_hash()
+    loop = PlainGraphNode(0)
+    loop.add_edge('me', loop)
+    with expecting(ValueError):
+        loop.content_hash()
+    # Container values are hashed by content, so these don't collide
+    # (hash(-1) == hash(-2), and lists used to all hash the same)
+    a = from_dict(d([('ports', [80, 443]), ('timeout', -1)]))
+    b = from_dict(d([('ports', [22]), ('timeout', -2)]))
+    assert a.content_hash() != b.content_hash()
+    assert from_dict({'x': [1, {'y': (2.0, None)}]}).content_hash() == \
+        from_dict({'x': [True, {'y': (2, None)}]}).content_hash()
+    assert from_dict({'x': [1]}).content_hash() != \
+        from_dict({'x': (1,)}).content_hash()
+    # Equal values without a content encoding can hash differently, so their
+    # hashes aren't used to tell graphs apart
+    from decimal import Decimal
+    for v1, v2 in [(d([('k', 1)]), {'k': 1}), (Decimal(1), 1)]:
+        for make in (lambda v: P(v), lambda v: freeze(PlainGraphNode(v))):
+            n1, n2 = make(v1), make(v2)
+            n1.content_hash(), n2.content_hash()
+            assert n1.all_equals(n2) and n1.unordered_equals(n2)
+    assert from_dict({'x': [{'a': 1, 'b': 2}]}).content_hash() == \
+        from_dict({'x': [{'b': 2, 'a': 1}]}).content_hash()
+
+def test_diff_and_patch():
+    from vertigo.diff_fns import diff, patch
+    from vertigo.graph import GraphNode, freeze, PersistentGraphNode as P
+    from vertigo.misc_fns import from_dict
+
+    class Untouchable(GraphNode):
+        # A subtree that fails the test if diff() looks inside it
+        value = 'untouchable'
+        def key_iter(self):
+            raise AssertionError("diff() walked a shared subtree")
+        def _get_child(self, key):
+            raise AssertionError("diff() walked a shared subtree")
+
+    g1 = from_dict(d([
+        ('_self', 'root'),
+        ('a', d([('x', 1), ('y', 2)])),
+        ('b', d([('z', 3)])),
+        ('c', 4),
+    ]), cls=P).set_path('big', P('big', u=Untouchable()))
+    g2 = g1.set_value(('a', 'x'), 10).pop_path('c')
+    g2 = g2.set_path(('b', 'new'), P('new', child=P('child')))
+    ops = diff(g1, g2)
+    assert [op[:2] for op in ops] == [
+        ('set', ('a', 'x')),
+        ('add', ('b', 'new')),
+        ('remove', ('c',)),
+    ]
+    assert diff(g1, g1) == []
+    assert diff(g2, g1)[1:] == [('remove', ('b', 'new')), ('add', ('c',), g1['c'])]
+    # Patching a persistent graph makes a new version
+    g3 = patch(g1, ops)
+    assert g3.all_equals(g2)
+    assert g1['a', 'x'].value == 1
+    # Patching a plain graph changes it in place
+    plain1 = from_dict(d([('a', d([('x', 1), ('y', 2)])), ('b', 3)]))
+    plain2 = from_dict(d([('a', d([('x', 1)])), ('b', 30), ('c', None)]))
+    assert patch(plain1, diff(plain1, plain2)) is plain1
+    assert plain1.all_equals(plain2)
+    # Root values and reordered edges
+    assert diff(PlainGraphNode(1), PlainGraphNode(2)) == [('set', (), 2)]
+    assert diff(from_dict(d([('a', 1), ('b', 2)])),
+        from_dict(d([('b', 2), ('a', 1)]))) == []
+    # Matching cached hashes can stand in for identity
+    f1, f2 = freeze(plain2), freeze(plain_copy(plain2))
+    f1.content_hash(), f2.content_hash()
+    assert diff(f1, f2, trust_hashes=True) == diff(f1, f2) == []
+    # Differing list values don't collide, so nothing is hidden
+    fa = freeze(from_dict(d([('ports', [80, 443]), ('timeout', -1)])))
+    fb = freeze(from_dict(d([('ports', [22]), ('timeout', -2)])))
+    fa.content_hash(), fb.content_hash()
+    assert diff(fa, fb, trust_hashes=True) == diff(fa, fb) == [
+        ('set', ('ports',), [22]), ('set', ('timeout',), -2)]
+    # Hashes of values that aren't encoded by content aren't trusted
+    class Opaque(object):
+        def __hash__(self):
+            return 0
+    fo1, fo2 = freeze(PlainGraphNode(Opaque())), freeze(PlainGraphNode(Opaque()))
+    assert fo1.content_hash() == fo2.content_hash()
+    assert len(diff(fo1, fo2, trust_hashes=True)) == 1
+    with expecting(ValueError):
+        patch(plain1, [('frobnicate', ())])
+
+def test_path_index():
+    from vertigo.graph import PathIndex, StarGraphNode, freeze
+    g = StarGraphNode.build({
+        'a': {'b': {'c': 1}},
+        'x/y': 'slashed key',
+        '*': {'_self': 'star', 'deep': 2},
+    })
+    idx = PathIndex(g)
+    assert idx['a', 'b', 'c'] is g['a', 'b', 'c']
+    assert idx[['a', 'b']] is g['a', 'b']
+    assert idx['a/b/c'] is g['a', 'b', 'c']
+    assert idx['x/y'].value == 'slashed key'
+    assert idx[()] is g
+    assert idx['a'] is g['a']
+    # Paths the graph answers without listing them still work
+    assert idx['anything', 'deep'].value == 2
+    assert ('anything', 'deep') in idx
+    assert ('a', 'nope') not in idx
+    assert idx.get_path(('a', 'nope'), None) is None
+    with expecting(KeyError):
+        idx['a', 'b', 'nope']
+    assert idx.all_equals(g)
+    # Changes show up after refresh()
+    g['a', 'b'].add_edge('d', StarGraphNode(3))
+    idx.refresh()
+    assert idx['a/b/d'].value == 3
+    # Frozen graphs work, too, and sep=None disables string splitting
+    fidx = PathIndex(freeze(g), sep=None)
+    assert fidx['a', 'b', 'd'].value == 3
+    assert 'a/b/d' not in fidx
+    # get_path is iterative and reports the failing prefix
+    deep = PlainGraphNode(0)
+    for i in range(5000):
+        deep = PlainGraphNode(i, next=deep)
+    assert deep[('next',) * 5000].value == 0
+    try:
+        deep[('next',) * 5000 + ('nope', 'more')]
+    except KeyError as e:
+        assert e.args == ('next',) * 5000 + ('nope',)
+
+def test_replace():
+    from vertigo import replace, make_path_graph
+    g1 = PlainGraphNode.build({'a': {'b': {'c': 1}, 'd': 2}, 'e': 3})
+    g2 = PlainGraphNode.build({'a': {'b': {'c': 'C'}, 'd': 'D'}, 'e': 'E'})
+    result = replace(g1, g2)
+    assert result.all_equals(g2)
+    assert list(result.key_iter()) == list(g1.key_iter())
+    g3 = PlainGraphNode.build({'a': {'b': 'B'}})
+    try:
+        replace(g1, g3)
+    except KeyError as e:
+        assert e.args == ('a', 'b', 'c')
+    else: # pragma: no cover
+        assert False, "Expected KeyError"
+    result = replace(g1, g3, default_value='-')
+    assert result['a', 'b'].value == 'B'
+    assert result['a', 'b', 'c'].value == '-'
+    assert result['e'].value == '-'
+    # Dicts are built into graphs first, as walkers do
+    assert replace({'a': {'b': {'c': 1}, 'd': 2}, 'e': 3}, g2).all_equals(g2)
+    # Deep graphs don't hit the recursion limit
+    deep = PlainGraphNode(0)
+    for i in range(5000):
+        deep = PlainGraphNode(i+1, next=deep)
+    result = replace(deep, make_path_graph(deep))
+    assert result[('next',) * 5000].value == ('next',) * 5000
+
+def test_iter_flat():
+    from vertigo import iter_flat, to_flat, from_flat
+    g = from_flat(d([('a/b', 1), ('a/c', None), ('e', 2)]))
+    assert list(iter_flat(g)) == [
+        ('', None), ('a', None), ('a/b', 1), ('a/c', None), ('e', 2)]
+    assert list(iter_flat(g, minimize=True)) == [
+        ('a/b', 1), ('a/c', None), ('e', 2)]
+    assert list(iter_flat(g, sep=None))[:2] == [((), None), (('a',), None)]
+    # Leaves holding None are kept by minimize whether or not it's ordered
+    assert to_flat(g, minimize=True, ordered=True) == to_flat(g, minimize=True)
+    assert from_flat(to_flat(g, sep=None), sep=None).all_equals(g)
+    # Deep graphs are fine
+    deep = PlainGraphNode(0)
+    for i in range(5000):
+        deep = PlainGraphNode(None, next=deep)
+    flat = to_flat(deep, minimize=True, sep=None)
+    assert flat == {('next',) * 5000: 0}
+
+def test_from_flat_bulk():
+    from vertigo import from_flat, to_flat
+    from vertigo.graph import StarGraphNode
+    flat = d([('a/b/c', 1), ('a/b/d', 2), ('a', 3), ('x/y', None)])
+    g = from_flat(flat, cls=StarGraphNode)
+    assert to_flat(g, minimize=True) == dict(flat)
+    assert list(g['a', 'b'].key_iter()) == ['c', 'd']
+    # Intermediate nodes use cls too
+    assert type(g['a', 'b']) is StarGraphNode
+    assert type(g['x']) is StarGraphNode
+    # Duplicates are caught even when the first value is falsy
+    with expecting(ValueError):
+        from_flat({'a/b': 0, '/a/b/': 1})
+    with expecting(ValueError):
+        from_flat({('a', 'b'): None, 'a/b': 1})
+    # Deep paths are fine
+    g = from_flat({('k',) * 5000: 'leaf'}, sep=None)
+    assert g[('k',) * 5000].value == 'leaf'
+
+def test_load_json():
+    import io, json
+    from vertigo.load_json import load_json_graph, iter_json_graph
+    from vertigo.misc_fns import from_dict
+    from vertigo.graph import FrozenGraph, JsonGraphNode, StarGraphNode
+    data = d([
+        ('_self', 'root'),
+        ('nums', [1, 2.5, -3e10, 12345678901234567890]),
+        ('text', u'caf\xe9 ☃ "quoted"'),
+        ('nested', d([('_self', True), ('a', {'b': None}), ('c', [])])),
+        ('empty', {}),
+    ])
+    text = json.dumps(data)
+    g = load_json_graph(text)
+    expected = from_dict(d([
+        ('_self', 'root'),
+        ('nums', d([('0', 1), ('1', 2.5), ('2', -3e10),
+            ('3', 12345678901234567890)])),
+        ('text', data['text']),
+        ('nested', d([('_self', True), ('a', {'b': None}), ('c', {})])),
+        ('empty', {}),
+    ]))
+    assert g.all_equals(expected)
+    # Same structure as JsonGraphNode, except lists hold no value themselves
+    assert g['nums'].value is None
+    assert list(g['nums'].key_iter()) == list(JsonGraphNode(data)['nums'].key_iter())
+    assert g['nums', '3'].value == 12345678901234567890
+    assert load_json_graph(io.BytesIO(text.encode('utf-8'))).all_equals(g)
+    assert isinstance(load_json_graph(text, frozen=True), FrozenGraph)
+    assert type(load_json_graph(text, cls=StarGraphNode)['nested']) is StarGraphNode
+    # A '_self' holding an object or a list stays plain, as with from_dict
+    for doc in ['{"_self": {"a": 1, "_self": null, "b": [2, {"c": 3}]}, "x": 4}',
+                '{"_self": [1, {"_self": 2}], "x": {"_self": {"y": []}}}']:
+        g2 = load_json_graph(doc)
+        assert g2.all_equals(from_dict(json.loads(doc)))
+        assert g2.value == json.loads(doc)['_self']
+        assert list(iter_json_graph(io.StringIO(doc)))[0] == (
+            '_self', json.loads(doc)['_self'])
+    # Incremental loading gives the same children, at any chunk size
+    for chunk_size in (1, 3, 1 << 16):
+        for fp in (io.StringIO(text), io.BytesIO(text.encode('utf-8'))):
+            items = list(iter_json_graph(fp, chunk_size=chunk_size))
+            assert items[0] == ('_self', 'root')
+            assert [k for k, _ in items[1:]] == list(g.key_iter())
+            for key, node in items[1:]:
+                assert node.all_equals(g[key])
+    # Chunks may end anywhere, even in the middle of a top-level number
+    class Pieces(object):
+        def __init__(self, *pieces):
+            self.pieces = [p for p in pieces if p]
+        def read(self, size):
+            return self.pieces.pop(0) if self.pieces else u''
+    doc = u'{"a": 2.5, "b": -3e10, "c": 1.5e-3, "d": [1, 20], "e": 12}'
+    expected = list(iter_json_graph(io.StringIO(doc)))
+    for i in range(len(doc) + 1):
+        items = list(iter_json_graph(Pieces(doc[:i], doc[i:]), chunk_size=1))
+        assert [(k, n.value) for k, n in items] == [
+            (k, n.value) for k, n in expected], i
+    # Top-level lists and empty documents
+    items = list(iter_json_graph(io.StringIO(u' [ 1, {"a": 2} , 345 ] ')))
+    assert [(k, n.value) for k, n in items] == [('0', 1), ('1', None), ('2', 345)]
+    assert list(iter_json_graph(io.StringIO(u'{ }'))) == []
+    with expecting(ValueError):
+        list(iter_json_graph(io.StringIO(u'{"a": 1 "b": 2}')))
+    with expecting(ValueError):
+        list(iter_json_graph(io.StringIO(u'{"a": [1, 2}')))
+
+def test_yaml_loaders_agree():
+    from vertigo.load_yaml import load_graph, VertigoYAMLLoader
+    from vertigo.load_yaml import VertigoYAMLCLoader, DefaultLoader
+    from vertigo.merge_fns import Omit
+    s = textwrap.dedent('''
+    base: &base
+        _self: 1
+        x: [1, 2]
+        y: !Omit
+    derived:
+        <<: *base
+        z: {q: 3}
+    alias: *base
+    zzz: 1
+    aaa: 2
+    ''')
+    g = load_graph(s, Loader=VertigoYAMLLoader)
+    assert g['base', 'y'].value is Omit
+    assert list(g['derived'].key_iter()) == ['x', 'y', 'z']
+    assert g['alias'] is g['base']
+    if VertigoYAMLCLoader is None: # pragma: no cover
+        assert DefaultLoader is VertigoYAMLLoader
+        return
+    assert DefaultLoader is VertigoYAMLCLoader
+    g2 = load_graph(s)
+    assert g2.all_equals(g)
+    assert list(g2.key_iter()) == list(g.key_iter())
+    assert g2['alias'] is g2['base']
+    assert g2['base', 'y'].value is Omit
+
+def test_binary_snapshot():
+    import io, os, tempfile
+    from vertigo.binary import dump_binary, load_binary, to_binary
+    from vertigo.binary import MmapGraphNode
+    from vertigo.graph import freeze
+    from vertigo.merge_fns import Omit
+    from vertigo.misc_fns import from_dict
+    g = from_dict(d([
+        ('_self', u'root ☃'),
+        ('ints', d([('small', -5), ('big', 2**70), ('zero', 0)])),
+        ('misc', d([('f', 1.5), ('b', b'\x00bytes'), ('t', True),
+            ('n', None), ('omit', Omit), ('list', [1, (2, 3)])])),
+        ('empty', {}),
+    ]))
+    g['ints'].add_edge(3, PlainGraphNode('non-string key'))
+    data = to_binary(g)
+    for source in (bytes(data), io.BytesIO(bytes(data))):
+        loaded = load_binary(source)
+        assert isinstance(loaded, MmapGraphNode)
+        assert loaded.all_equals(g)
+        assert list(loaded['ints'].key_iter()) == ['small', 'big', 'zero', 3]
+        assert loaded['misc', 'omit'].value is Omit
+        assert type(loaded['misc', 't'].value) is bool
+        assert loaded.get_path(('ints', 'nope'), None) is None
+        assert loaded.get_path(('empty', 'small'), None) is None
+        with expecting(KeyError):
+            loaded['nope']
+    # Real files are mapped, and frozen graphs dump the same way
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        dump_binary(freeze(g), path)
+        loaded = load_binary(path)
+        assert loaded.all_equals(g)
+        assert loaded['misc', 'list'].value == [1, (2, 3)]
+    finally:
+        del loaded
+        os.remove(path)
+    # Children are found by binary search, in any order they were added
+    names = ['k{}'.format(i) for i in range(200, 0, -1)]
+    wide = load_binary(bytes(to_binary(
+        PlainGraphNode(0, [(k, PlainGraphNode(k)) for k in names]))))
+    assert list(wide.key_iter()) == names
+    assert all(wide[k].value == k for k in names)
+    assert 'k0' not in wide
+    with expecting(ValueError):
+        load_binary(b'not a snapshot at all, not at all')
+    with expecting(ValueError):
+        load_binary(b'')
+
+def test_pickle():
+    import pickle
+    from vertigo.graph import DefaultGraphNode, StarGraphNode, JsonGraphNode
+    from vertigo.graph import PersistentGraphNode
+    shared = PlainGraphNode('shared')
+    g = PlainGraphNode('root', [
+        ('a', shared),
+        ('b', PlainGraphNode(None, x=shared)),
+        ('star', StarGraphNode.build({'*': 1})),
+        ('default', DefaultGraphNode(2, default='dflt')),
+        ('json', JsonGraphNode({'k': [1, 2]})),
+    ])
+    g['b'].add_edge('cycle', g)
+    for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+        g2 = pickle.loads(pickle.dumps(g, protocol))
+        assert g2['a'] is g2['b', 'x']
+        assert g2['b', 'cycle'] is g2
+        assert list(g2.key_iter()) == list(g.key_iter())
+        assert type(g2['star']) is StarGraphNode
+        assert g2['star', 'anything'].value == 1
+        assert g2['default', 'missing'].value == 'dflt'
+        assert g2['json', 'k', '1'].value == 2
+    p = PersistentGraphNode(1, a=PersistentGraphNode(2))
+    p.content_hash()
+    p2 = pickle.loads(pickle.dumps(p))
+    assert p2.all_equals(p) and p2._hashes is None
+    assert p2.set_value('a', 3)['a'].value == 3
+    # Deep graphs don't hit the recursion limit
+    deep = PlainGraphNode(0)
+    for i in range(100000):
+        deep = PlainGraphNode(i+1, next=deep)
+    deep2 = pickle.loads(pickle.dumps(deep, pickle.HIGHEST_PROTOCOL))
+    assert deep2[('next',) * 100000].value == 0
+    # copy.copy stays shallow; copy.deepcopy copies the whole graph
+    import copy
+    for node in (g, g['default'], g['star'], p):
+        c = copy.copy(node)
+        assert type(c) is type(node) and c is not node
+        assert c._edges is node._edges and c.value == node.value
+    assert copy.copy(g['default'])['missing'].value == 'dflt'
+    g3 = copy.deepcopy(g)
+    assert g3['a'] is g3['b', 'x'] and g3['a'] is not g['a']
+    assert g3['b', 'cycle'] is g3
+    assert copy.deepcopy(deep)[('next',) * 100000].value == 0
+
+def _read_shared(name, path):
+    from vertigo.binary import attach_shared
+    return attach_shared(name)[path].value
+
+def test_shared_graph():
+    import multiprocessing
+    from vertigo.binary import publish_shared, attach_shared, MmapGraphNode
+    from vertigo.misc_fns import from_dict
+    g = from_dict({'a': {'_self': 1, 'b': [2, 3]}, 'c': u'see ☃'})
+    shm = publish_shared(g)
+    try:
+        g2 = attach_shared(shm.name)
+        assert isinstance(g2, MmapGraphNode)
+        assert g2.all_equals(g)
+        child = g2['a']
+        del g2
+        # The block stays mapped while any node is alive
+        assert child['b'].value == [2, 3]
+        del child
+        if 'fork' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(2) as pool:
+                assert pool.starmap(_read_shared,
+                    [(shm.name, 'c'), (shm.name, ('a', 'b'))]) == [u'see ☃', [2, 3]]
+        # Workers attaching and exiting doesn't unlink the block
+        assert attach_shared(shm.name)['a'].value == 1
+    finally:
+        shm.close()
+        shm.unlink()
+
+def test_caching_wrapper():
+    from vertigo.wrappers import CachingWrapper, GraphWrapper
+    from vertigo.graph import JsonGraphNode
+    from vertigo.misc_fns import from_dict
+    g1 = from_dict({'a': {'b': 1, 'c': 2}, 'd': 3})
+    g2 = from_dict({'a': {'b': 10}, 'e': 4})
+    zipped = vgz.zip(g1, g2)
+    cached = CachingWrapper(zipped, maxsize=None)
+    assert cached.all_equals(zipped)
+    assert cached['a', 'b'] is cached['a', 'b']
+    assert cached['a', 'b'].value == (1, 10)
+    info = cached.cache_info()
+    assert info.currsize == info.misses == 2 and info.maxsize is None
+    cached.all_equals(zipped)
+    assert cached.cache_info().misses == info.misses
+    assert cached.cache_info().hits > info.hits
+    with expecting(KeyError):
+        cached['nope']
+    # The least recently used node is dropped past maxsize
+    small = CachingWrapper(JsonGraphNode({'x': [1, 2, 3], 'y': 4}), maxsize=2)
+    x = small['x']
+    small['x', '0']
+    small['y']
+    assert small.cache_info().currsize == 2
+    assert small['x'] is not x
+    assert small['y'] is small['y']
+    small.cache_clear()
+    assert small.cache_info() == (0, 0, 2, 0)
+    # maxsize=0 means no caching, as with functools.lru_cache
+    for maxsize in (0, -1):
+        uncached = CachingWrapper(JsonGraphNode({'a': 1}), maxsize=maxsize)
+        assert uncached['a'].value == 1 and 'a' in uncached
+        assert uncached['a'] is not uncached['a']
+        assert uncached.cache_info() == (0, 4, 0, 0)
+    # _all_slots is computed once per class
+    assert GraphWrapper._all_slots() is GraphWrapper._all_slots()
+
+def test_fuse():
+    import random
+    from vertigo.wrappers import fuse, FusedWrapper, SortedWrapper
+    from vertigo.wrappers import EdgeRestriction, ValueOverlay, DefaultWrapper
+    from vertigo.misc_fns import from_dict, apply, from_flat, imap
+    g = from_dict(d([('_self', 1), ('b', d([('_self', 7), ('y', 2), ('x', 3)])),
+        ('a', 4), ('c', d([('_self', 5), ('z', 6)]))]))
+    fn_g = from_flat({'': lambda v: -v, 'b/x': lambda v: v * 100, 'c': None})
+    layers = [
+        lambda h: imap(h, lambda v: v + 1),
+        lambda h: imap(h, lambda v: v * 2),
+        SortedWrapper,
+        lambda h: EdgeRestriction(h, ['a', 'b', 'x']),
+        lambda h: EdgeRestriction(h, ['b', 'c']),
+        lambda h: ValueOverlay(h, 1000),
+        lambda h: apply(h, fn_g),
+    ]
+    rng = random.Random(0)
+    for _ in range(200):
+        stacked = g
+        for _ in range(rng.randint(1, 8)):
+            stacked = rng.choice(layers)(stacked)
+        fused = fuse(stacked)
+        assert type(fused) is FusedWrapper and fused.graph is g
+        assert fused.all_equals(stacked)
+        for key in stacked.key_iter():
+            assert list(fused[key].key_iter()) == list(stacked[key].key_iter())
+        assert fuse(fused).all_equals(stacked)
+    # Consecutive maps become one op
+    fused = fuse(imap(imap(imap(g, str), len), lambda n: n + 1))
+    assert len(fused.ops) == 1 and fused['a'].value == 2
+    # Fusion stops at layers it doesn't know about
+    inner = DefaultWrapper(g, default=0)
+    fused = fuse(imap(SortedWrapper(inner), str))
+    assert fused.graph is inner
+    assert fused['nope'].value == '0'
+    assert fuse(g) is g
+    with expecting(KeyError):
+        fuse(EdgeRestriction(g, ['a']))['b']
+
+def test_pipeline():
+    from vertigo import pipeline, overlay, fill_nones
+    from vertigo.misc_fns import from_dict, apply, map
+    from vertigo.wrappers import FusedWrapper
+    g = from_dict(d([('_self', 1), ('a', d([('_self', None), ('x', 2)])),
+        ('b', 3), ('c', None)]))
+    other = from_dict({'a': {'y': 10}, 'c': 5, 'd': 6})
+    fn_g = from_dict({'b': lambda v: -v})
+    p = (pipeline(g).map(lambda v: v and v * 2).fill_nones(0)
+        .apply(fn_g).overlay(other, merge_fn='union'))
+    eager = overlay(apply(fill_nones(map(g, lambda v: v and v * 2), 0), fn_g),
+        other, merge_fn='union')
+    assert p.materialize().all_equals(eager)
+    assert p.lazy().all_equals(eager)
+    # Pipelines are immutable, and may be overlaid on each other
+    restricted = p.restrict(['a', 'd']).restrict(['a', 'b', 'c'])
+    assert list(restricted.materialize().key_iter()) == ['a']
+    assert list(p.materialize().key_iter()) == ['a', 'b', 'c', 'd']
+    nested = pipeline(other).overlay(p)
+    assert nested.materialize()['c'].value == 5
+    # Restrictions move to the source and into distributive overlays
+    plan = restricted.plan()
+    assert [step[0] for step in plan] == [
+        'restrict', 'map', 'map', 'apply', 'overlay']
+    assert plan[0][1] == frozenset(['a'])
+    strict = pipeline(g).overlay(other, merge_fn='strict').restrict(['a'])
+    assert [step[0] for step in strict.plan()] == ['overlay', 'restrict']
+    # Maps above the overlay are fused into one layer
+    lazy = p.map(str).map(len).lazy()
+    assert type(lazy) is FusedWrapper and len(lazy.ops) == 1
+    # Restricted-away subtrees are never visited
+    visited = []
+    def spy(v):
+        visited.append(v)
+        return v
+    pipeline(g).map(spy).map(spy).restrict(['b']).materialize()
+    assert sorted(visited) == [1, 1, 3, 3]
+    with expecting(TypeError):
+        pipeline(g).overlay(other, bogus=True)
+
+def test_set_based_merge_fns():
+    from vertigo.graph import StarGraphNode, freeze
+    from vertigo.misc_fns import from_dict
+    g1 = from_dict(d([('a', 1), ('b', 2), ('c', 3)]))
+    g2 = from_dict(d([('c', 30), ('a', 10), ('d', 40)]))
+    star = StarGraphNode.build(d([('b', 200), ('*', 100)]))
+    assert vgz.union([g1, g2]) == ['a', 'b', 'c', 'd']
+    assert vgz.intersection([g1, None, freeze(g2)]) == ['a', 'c']
+    assert vgz.first([g1, g2]) == ['a', 'b', 'c']
+    assert vgz.last([g1, g2]) == ['c', 'a', 'd']
+    assert vgz.last([g1, None]) == []
+    # Unlisted children of open graphs still count
+    assert vgz.intersection([g1, star]) == ['a', 'b', 'c']
+    z = vgz.izip(g1, star)
+    assert [(k, z[k].value) for k in z.key_iter()] == [
+        ('a', (1, 100)), ('b', (2, 200)), ('c', (3, 100))]
+    with expecting(vgz.StructureMismatch):
+        vgz.strict([g1, g2])
+    with expecting(vgz.StructureMismatch):
+        vgz.strict([g1, star]) # g1 has no '*'
+    assert vgz.strict([g1, freeze(g1)]) == ['a', 'b', 'c']
+    # Zipped nodes skip lookups for keys a closed graph doesn't list
+    z = vgz.izip(g1, g2, merge_fn='union')
+    assert list(z.key_iter()) == ['a', 'b', 'c', 'd']
+    assert z['b'].value == (2, None) and z['d'].value == (None, 40)
+    # Custom merge_fns can ask for the key lists too
+    calls = []
+    @vgz.with_key_lists
+    def longest(graphs, key_lists):
+        calls.append(key_lists)
+        return max(key_lists, key=len)
+    z = vgz.izip(g1, from_dict({'x': 1}), merge_fn=longest)
+    assert list(z.key_iter()) == ['a', 'b', 'c']
+    assert calls == [[['a', 'b', 'c'], ['x']]]
+    assert vgz.izip(g1, g2, merge_fn=lambda gs: ['a'])['a'].value == (1, 10)
+
+def test_zip_views_stay_live():
+    from vertigo.graph import freeze
+    from vertigo.merge_fns import overlay
+    from vertigo.misc_fns import from_dict
+    g1 = from_dict(d([('a', 1), ('b', 2)]))
+    g2 = from_dict(d([('b', 20)]))
+    z = vgz.izip(g1, g2, merge_fn='union')
+    assert list(z.key_iter()) == ['a', 'b']
+    g1.add_edge('c', PlainGraphNode(3))
+    assert list(z.key_iter()) == ['a', 'b', 'c']
+    assert z['c'].value == (3, None)
+    g1.pop_edge('a')
+    assert list(z.key_iter()) == ['b', 'c']
+    with expecting(KeyError):
+        z['a']
+    cfg = from_dict({'x': 1})
+    defaults = from_dict(d([('x', 0), ('y', 0)]))
+    view = vgz.izip(cfg, defaults, merge_fn='first')
+    list(view.key_iter())
+    cfg.add_edge('y', PlainGraphNode(5))
+    assert list(view.key_iter()) == ['x', 'y']
+    assert overlay(cfg, defaults)['y'].value == 5
+    # Immutable inputs can't change, so their key lists are kept
+    fz = vgz.izip(freeze(g1), freeze(g2), merge_fn='union')
+    assert list(fz.key_iter()) == ['b', 'c']
+    assert fz._key_lists is not None
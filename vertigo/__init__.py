@@ -1,13 +1,18 @@
 from .graph import Graphable, GraphNode, PlainGraphNode, plain_copy
 from .graph import GraphableGraphNode, ObjectGraphNode, DefaultGraphNode
-from .graph import StarGraphNode, PathGraph
-from .walker import Walker, walk, top_down, bottom_up
+from .graph import StarGraphNode, PathGraph, FrozenGraph, freeze
+from .graph import PersistentGraphNode, HashConsBuilder, PathIndex
+from .walker import Walker, walk, top_down, bottom_up, Prune, Stop, CycleError
+from .walker import iter_events
 from .zip_fns import izip, zip, unzip
 from .misc_fns import make_path_graph, imap, map, replace, fill_nones, dbg_print
 from .misc_fns import ascii_tree, to_dict, from_dict, to_flat, from_flat, pick
-from .misc_fns import apply
+from .misc_fns import iter_flat, apply, vmap, dedupe
 from .merge_fns import overlay, Omit, merge
+from .diff_fns import diff, patch
 from .wrappers import GraphWrapper, SortedWrapper, ValueOverlay, EdgeRestriction
+from .wrappers import CachingWrapper, FusedWrapper, fuse
+from .pipeline_fns import Pipeline, pipeline
 
 __all__ = [
     'Graphable',
@@ -19,10 +24,19 @@ __all__ = [
     'DefaultGraphNode',
     'StarGraphNode',
     'PathGraph',
+    'FrozenGraph',
+    'freeze',
+    'PersistentGraphNode',
+    'HashConsBuilder',
+    'PathIndex',
     'Walker',
     'walk',
     'top_down',
     'bottom_up',
+    'Prune',
+    'Stop',
+    'CycleError',
+    'iter_events',
     'izip',
     'zip',
     'unzip',
@@ -33,17 +47,27 @@ __all__ = [
     'fill_nones',
     'pick',
     'apply',
+    'vmap',
+    'dedupe',
     'ascii_tree',
     'dbg_print',
     'to_dict',
     'from_dict',
     'to_flat',
+    'iter_flat',
     'from_flat',
     'overlay',
     'Omit',
     'merge',
+    'diff',
+    'patch',
     'GraphWrapper',
     'SortedWrapper',
     'ValueOverlay',
     'EdgeRestriction',
+    'CachingWrapper',
+    'FusedWrapper',
+    'fuse',
+    'Pipeline',
+    'pipeline',
 ]
@@ -0,0 +1,330 @@
+'''A compact binary snapshot format for graphs, readable straight from mmap.
+
+A snapshot is laid out as follows, with every integer little-endian and every
+section starting on an 8-byte boundary:
+
+- header: magic b'VRTG', format version (u32), then the node count, key
+  count, and byte offsets of the key, node and value sections (all u64)
+- key table: (key count + 1) u64 offsets into the key blob that follows, one
+  encoded key per slot
+- node table: five columns in the same breadth-first numbering as
+  FrozenGraph - child offsets ((nodes + 1) x i64), value offsets into the
+  value section ((nodes + 1) x u64), edge key ids (nodes x i32, -1 for the
+  root), and each node's children sorted by key id, as their key ids (nodes x
+  i32) and positions (nodes x i64), so that children can be found by binary
+  search
+- value section: one encoded value per node
+
+Values and keys are encoded as a one-byte tag followed by a payload: None,
+booleans, Omit, 64-bit ints, floats, str and bytes have compact encodings, and
+anything else is pickled. Because of the pickle fallback, only load snapshots
+you trust.
+'''
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+try: # pragma: no cover
+    import multiprocessing
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError: # pragma: no cover
+    shared_memory = None
+
+from .graph import GraphNode, freeze, _find_child
+from .merge_fns import Omit
+
+MAGIC = b'VRTG'
+VERSION = 2
+_HEADER = struct.Struct('<4sI5Q')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_LITTLE = sys.byteorder == 'little'
+_CONSTANTS = {b'N': None, b'T': True, b'F': False, b'O': Omit}
+
+def _encode(value):
+    kind = type(value)
+    if value is None:
+        return b'N'
+    if value is Omit:
+        return b'O'
+    if kind is bool:
+        return b'T' if value else b'F'
+    if kind is int:
+        if -2**63 <= value < 2**63:
+            return b'i' + _INT.pack(value)
+        return b'I' + str(value).encode('ascii')
+    if kind is float:
+        return b'd' + _FLOAT.pack(value)
+    if kind is bytes:
+        return b'b' + value
+    if kind is str:
+        return b's' + value.encode('utf-8')
+    return b'p' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+def _decode(buf, lo, hi):
+    tag = bytes(buf[lo:lo+1])
+    if tag in _CONSTANTS:
+        return _CONSTANTS[tag]
+    payload = buf[lo+1:hi]
+    if tag == b'i':
+        return _INT.unpack(payload)[0]
+    if tag == b'd':
+        return _FLOAT.unpack(payload)[0]
+    if tag == b's':
+        return bytes(payload).decode('utf-8')
+    if tag == b'b':
+        return bytes(payload)
+    if tag == b'I':
+        return int(bytes(payload))
+    if tag == b'p':
+        return pickle.loads(bytes(payload))
+    raise ValueError("Unknown value tag {!r}".format(tag))
+
+def _pad(out):
+    out.extend(b'\0' * (-len(out) % 8))
+
+def _write_column(out, typecode, items):
+    column = array(typecode, items)
+    if not _LITTLE: # pragma: no cover
+        column.byteswap()
+    out.extend(column.tobytes())
+
+def _write_blob(out, items):
+    '''Write a u64 offset column followed by the encoded items.'''
+    encoded = [_encode(item) for item in items]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    _write_column(out, 'Q', offsets)
+    for data in encoded:
+        out.extend(data)
+
+def _read_column(buf, at, count, typecode):
+    size = array(typecode).itemsize
+    view = memoryview(buf)[at:at+count*size]
+    if _LITTLE:
+        return view.cast(typecode)
+    column = array(typecode) # pragma: no cover
+    column.frombytes(view) # pragma: no cover
+    column.byteswap() # pragma: no cover
+    return column # pragma: no cover
+
+def to_binary(graph):
+    '''Return the snapshot of graph as a bytearray; see dump_binary().'''
+    store = freeze(graph)._store
+    n_nodes, n_keys = len(store.values), len(store.keys)
+    out = bytearray(_HEADER.size)
+    _pad(out)
+    keys_at = len(out)
+    _write_blob(out, store.keys)
+    _pad(out)
+    nodes_at = len(out)
+    _write_column(out, 'q', store.offsets)
+    values = [_encode(value) for value in store.values]
+    value_offsets = [0]
+    for data in values:
+        value_offsets.append(value_offsets[-1] + len(data))
+    _write_column(out, 'Q', value_offsets)
+    _write_column(out, 'i', store.key_ids)
+    sorted_ids, positions = store.child_lookup()
+    _write_column(out, 'i', sorted_ids)
+    _write_column(out, 'q', positions)
+    _pad(out)
+    values_at = len(out)
+    for data in values:
+        out.extend(data)
+    _HEADER.pack_into(out, 0, MAGIC, VERSION, n_nodes, n_keys, keys_at,
+        nodes_at, values_at)
+    return out
+
+def dump_binary(graph, file):
+    '''Write a binary snapshot of graph to file, a filename or binary file.
+
+    Like freeze(), which it uses, this duplicates nodes that appear more than
+    once and will never finish on a graph with cycles.
+    '''
+    data = to_binary(graph)
+    if hasattr(file, 'write'):
+        file.write(data)
+    else:
+        with open(file, 'wb') as f:
+            f.write(data)
+
+
+class _BinaryStore(object):
+    # The columns of a snapshot, read in place from any buffer. Only the key
+    # table is decoded up front; values are decoded as they're requested.
+    # owner is whatever must stay open for buf to remain valid.
+    __slots__ = ('buf', 'offsets', 'key_ids', 'value_offsets', 'values_at',
+        'sorted_ids', 'positions', 'keys', 'key_index', 'owner')
+    def __init__(self, buf, owner=None):
+        if len(buf) < _HEADER.size:
+            raise ValueError("Not a vertigo binary snapshot")
+        magic, version, n_nodes, n_keys, keys_at, nodes_at, values_at = \
+            _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a vertigo binary snapshot")
+        if version != VERSION:
+            raise ValueError("Unsupported snapshot version {}".format(version))
+        self.buf = buf
+        self.owner = owner
+        key_offsets = _read_column(buf, keys_at, n_keys + 1, 'Q')
+        blob_at = keys_at + 8 * (n_keys + 1)
+        self.keys = [_decode(buf, blob_at + key_offsets[i],
+            blob_at + key_offsets[i+1]) for i in range(n_keys)]
+        self.key_index = dict((key, i) for i, key in enumerate(self.keys))
+        self.offsets = _read_column(buf, nodes_at, n_nodes + 1, 'q')
+        at = nodes_at + 8 * (n_nodes + 1)
+        self.value_offsets = _read_column(buf, at, n_nodes + 1, 'Q')
+        at += 8 * (n_nodes + 1)
+        self.key_ids = _read_column(buf, at, n_nodes, 'i')
+        self.sorted_ids = _read_column(buf, at + 4 * n_nodes, n_nodes, 'i')
+        self.positions = _read_column(buf, at + 8 * n_nodes, n_nodes, 'q')
+        self.values_at = values_at
+
+    def __del__(self):
+        # Drop the views into buf before whatever owns it is closed.
+        for name in ('offsets', 'value_offsets', 'key_ids', 'sorted_ids',
+                'positions', 'buf'):
+            setattr(self, name, None)
+        self.owner = None
+
+    def value(self, index):
+        at = self.values_at
+        return _decode(self.buf, at + self.value_offsets[index],
+            at + self.value_offsets[index+1])
+
+
+class MmapGraphNode(GraphNode):
+    '''A read-only graph read on demand from a binary snapshot.
+
+    Use load_binary() to open a snapshot written by dump_binary():
+
+    >>> import io
+    >>> from .graph import PlainGraphNode
+    >>> f = io.BytesIO()
+    >>> dump_binary(PlainGraphNode.build({'a': {'b': 'B'}, 'c': [1, 2]}), f)
+    >>> g = load_binary(f)
+    >>> g['a', 'b'].value
+    'B'
+    >>> g['c'].value
+    [1, 2]
+    >>> sorted(g.key_iter())
+    ['a', 'c']
+
+    Opening a snapshot only reads its header and key table; each value is
+    decoded when it's asked for, so a process that only needs part of a large
+    graph never touches the rest. When the snapshot is a file it's mapped with
+    mmap, so processes that load the same file share its pages.
+
+    As with FrozenGraph, the nodes are views created on request, so g['a'] is
+    not g['a'], and they can't be modified.
+    '''
+    __slots__ = ('_store', '_index')
+    def __init__(self, store, index=0):
+        self._store = store
+        self._index = index
+
+    @property
+    def value(self):
+        return self._store.value(self._index)
+
+    def key_iter(self):
+        store = self._store
+        keys = store.keys
+        lo, hi = store.offsets[self._index], store.offsets[self._index+1]
+        return [keys[k] for k in store.key_ids[lo:hi]]
+
+    def edge_iter(self):
+        store = self._store
+        keys, key_ids = store.keys, store.key_ids
+        for j in range(store.offsets[self._index], store.offsets[self._index+1]):
+            yield keys[key_ids[j]], MmapGraphNode(store, j)
+
+    def _get_child(self, key):
+        store = self._store
+        key_id = store.key_index.get(key)
+        if key_id is None:
+            raise KeyError(key)
+        j = _find_child(store.offsets, store.sorted_ids, store.positions,
+            self._index, key_id)
+        if j < 0:
+            raise KeyError(key)
+        return MmapGraphNode(store, j)
+
+def load_binary(file):
+    '''Open a snapshot written by dump_binary() as an MmapGraphNode.
+
+    file may be a filename, a binary file object, or any object supporting the
+    buffer protocol (bytes, bytearray, mmap...). Real files are mapped
+    read-only rather than read into memory.
+    '''
+    if isinstance(file, (bytes, bytearray, memoryview, mmap.mmap)):
+        buf = file
+    elif hasattr(file, 'read'):
+        try:
+            buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, OSError):
+            # Not a real file (e.g. BytesIO), or an empty one
+            file.seek(0)
+            buf = file.read()
+    else:
+        with open(file, 'rb') as f:
+            return load_binary(f)
+    return MmapGraphNode(_BinaryStore(buf))
+
+# Names of the blocks published by this process
+_published = set()
+
+def _require_shared_memory():
+    if shared_memory is None: # pragma: no cover
+        raise ImportError("Shared memory graphs need Python 3.8 or later")
+
+def publish_shared(graph, name=None):
+    '''Copy a binary snapshot of graph into a new block of shared memory.
+
+    Returns the multiprocessing.shared_memory.SharedMemory holding it; pass its
+    .name to attach_shared() in other processes. The publishing process owns
+    the block and should close() and unlink() it once the workers are done.
+
+    >>> from .graph import PlainGraphNode
+    >>> shm = publish_shared(PlainGraphNode.build({'a': {'b': 'B'}}))
+    >>> g = attach_shared(shm.name)
+    >>> g['a', 'b'].value
+    'B'
+    >>> del g
+    >>> shm.close(); shm.unlink()
+    '''
+    _require_shared_memory()
+    data = to_binary(graph)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    _published.add(shm._name)
+    return shm
+
+def attach_shared(name):
+    '''Open the graph published under name by publish_shared().
+
+    The result is an MmapGraphNode reading straight from the shared block, so
+    every process attached to it shares one copy of the graph, and attaching
+    only costs decoding the key table. The block stays mapped as long as any
+    node of the graph is alive.
+
+    Attaching doesn't take ownership: the block isn't unlinked when this
+    process exits, even on Python versions whose resource tracker would do so
+    for any block it saw opened.
+    '''
+    _require_shared_memory()
+    if sys.version_info >= (3, 13): # pragma: no cover
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else: # pragma: no cover
+        # Attaching registers the block with the resource tracker, which would
+        # unlink it when this process exits, so take it off the tracker's list
+        # again. But multiprocessing workers share their parent's tracker, so
+        # there, as in the publishing process, the block must stay listed.
+        shm = shared_memory.SharedMemory(name=name)
+        if (shm._name not in _published
+                and multiprocessing.parent_process() is None):
+            resource_tracker.unregister(shm._name, 'shared_memory')
+    return MmapGraphNode(_BinaryStore(shm.buf, owner=shm))
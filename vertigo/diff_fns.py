@@ -0,0 +1,103 @@
+from .graph import Missing, PersistentGraphNode, _hashed_by_content
+from .zip_fns import izip
+
+def diff(g1, g2, trust_hashes=False):
+    '''List the changes needed to turn g1 into g2.
+
+    The result is a list of operations, in depth-first order:
+
+    ('set', path, value) - the value at path changed to value
+    ('add', path, node) - g2 has a new subtree at path
+    ('remove', path) - g2 has no node at path
+
+    >>> from .misc_fns import from_dict
+    >>> from collections import OrderedDict as d
+    >>> g1 = from_dict(d([('a', 1), ('b', d([('x', 2), ('y', 3)]))]))
+    >>> g2 = from_dict(d([('a', 1), ('b', d([('x', 20), ('z', 4)]))]))
+    >>> ops = diff(g1, g2)
+    >>> ops[:2]
+    [('set', ('b', 'x'), 20), ('remove', ('b', 'y'))]
+    >>> ops[2][:2], ops[2][2] is g2['b', 'z']
+    (('add', ('b', 'z')), True)
+
+    The walk is over izip(g1, g2, merge_fn='union', default=Missing), but it
+    never descends into subtrees that g1 and g2 share, so diffing two versions
+    of a PersistentGraphNode (or of any graph built by replacing only the
+    changed nodes) costs time in proportion to the size of the change, not the
+    size of the graph. Added subtrees aren't walked either.
+
+    If trust_hashes is True, then subtrees whose cached content hashes (see
+    GraphNode.content_hash) match are assumed equal and skipped too. This makes
+    diffing two FrozenGraphs with precomputed hashes fast. Hashes are only
+    trusted when every value below the node was hashed by content, which is
+    the case for graphs loaded from JSON or YAML; other subtrees are compared
+    as usual.
+
+    Edge order is ignored: a graph whose edges were only reordered has no
+    differences.
+    '''
+    ops = []
+    stack = [((), izip(g1, g2, merge_fn='union', default=Missing))]
+    while stack:
+        path, node = stack.pop()
+        n1, n2 = node.graphs
+        if n1 is None:
+            ops.append(('add', path, n2))
+            continue
+        if n2 is None:
+            ops.append(('remove', path))
+            continue
+        if n1 is n2:
+            continue
+        if trust_hashes:
+            h1 = n1._cached_hash(True)
+            if (h1 is not None and _hashed_by_content(h1)
+                    and h1 == n2._cached_hash(True)):
+                continue
+        if n1.value != n2.value:
+            ops.append(('set', path, n2.value))
+        edges = list(node.edge_iter())
+        stack.extend((path + (key,), child) for key, child in reversed(edges))
+    return ops
+
+def patch(graph, ops):
+    '''Apply the operations from diff() to a graph.
+
+    PlainGraphNodes (and other mutable graphs) are changed in place; patch()
+    returns the graph for convenience. A PersistentGraphNode can't be changed,
+    so patch() returns a new version of it instead.
+
+    >>> from .misc_fns import from_dict, dbg_print
+    >>> g1 = from_dict(dict(a=1, b=dict(x=2, y=3)))
+    >>> g2 = from_dict(dict(a=1, b=dict(x=20, z=4)))
+    >>> dbg_print(patch(g1, diff(g1, g2)))
+    root: None
+      +--a: 1
+      +--b: None
+         +--x: 20
+         +--z: 4
+
+    Added subtrees are inserted as-is rather than copied, so after patching g1
+    with diff(g1, g2) the two graphs may share nodes.
+    '''
+    persistent = isinstance(graph, PersistentGraphNode)
+    for op in ops:
+        kind, path = op[0], op[1]
+        if kind == 'set':
+            if persistent:
+                graph = graph.set_value(path, op[2])
+            else:
+                graph[path].value = op[2]
+        elif kind == 'add':
+            if persistent:
+                graph = graph.set_path(path, op[2])
+            else:
+                graph[path[:-1]].add_edge(path[-1], op[2])
+        elif kind == 'remove':
+            if persistent:
+                graph = graph.pop_path(path)
+            else:
+                graph[path[:-1]].pop_edge(path[-1])
+        else:
+            raise ValueError("Unknown patch operation: {!r}".format(kind))
+    return graph
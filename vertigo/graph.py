@@ -1,9 +1,13 @@
 from abc import ABCMeta, abstractmethod
-from collections import OrderedDict
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+import hashlib
 import sys
 
 if sys.version >= '3': # pragma: no cover
     basestring = unicode = str
+    from sys import intern
 
 
 class Missing(object):
@@ -11,6 +15,25 @@ class Missing(object):
     pass
 Missing = Missing()
 
+def intern_key(key):
+    '''Return the canonical copy of the edge label key.
+
+    Graph builders pass their keys through this, so that every edge with the
+    same label shares a single string object no matter how many times it was
+    parsed or built. This saves memory on large graphs and lets dict lookups on
+    those keys succeed on the identity check. Interning is process-wide, and
+    interned strings are freed once nothing refers to them.
+
+    >>> k1, k2 = ''.join(['time', 'out']), ''.join(['ti', 'meout'])
+    >>> k1 is k2
+    False
+    >>> intern_key(k1) is intern_key(k2)
+    True
+    '''
+    if type(key) is str:
+        return intern(key)
+    return key
+
 _GraphableBase = ABCMeta('_GraphableBase', (object, ), {})
 
 class Graphable(_GraphableBase):
@@ -95,40 +118,46 @@ class GraphNode(Graphable):
             return False
 
     def get_path(self, path, default=Missing):
-        if isinstance(path, (list, tuple)):
-            path = tuple(path)
-        else:
-            path = (path,)
-        if not path:
-            return self
-        try:
-            sub = self.get_child(path[0])
-        except KeyError:
-            if default is Missing:
-                raise KeyError(path[0])
-            return default
-        if len(path) == 1:
-            return sub
-        try:
-            return sub.get_path(path[1:], default)
-        except KeyError as e:
-            # Raise error on path to this point, because an error on ('foo',
-            # 'bar', 'baz') is more helpful than an error on 'baz'.
-            raise KeyError(*(path[0],)+e.args)
+        path = _as_path(path)
+        node = self
+        for i, key in enumerate(path):
+            try:
+                node = node.get_child(key)
+            except KeyError:
+                if default is not Missing:
+                    return default
+                # Raise error on path to this point, because an error on
+                # ('foo', 'bar', 'baz') is more helpful than an error on 'baz'.
+                raise KeyError(*path[:i+1])
+        return node
 
 
     def all_equals(self, other):
-        '''Test if this graph and all its children equal other.'''
+        '''Test if this graph and all its children equal other.
+
+        Identical subtrees are skipped, and if both graphs already have cached
+        content hashes (see content_hash) that differ and were computed by
+        content, this returns False without looking any further.
+        '''
+        if self is other:
+            return True
+        if _hashes_differ(self, other, True):
+            return False
         if self.value != other.value:
             return False
         kids = list(self.edge_iter())
         okids = list(other.edge_iter())
         if len(kids) != len(okids):
             return False
-        return all(c1.all_equals(c2) for ((_,c1), (_,c2)) in zip(kids, okids))
+        return all(k1 == k2 and c1.all_equals(c2)
+            for ((k1,c1), (k2,c2)) in zip(kids, okids))
 
     def unordered_equals(self, other):
         '''Like all_equals, but ignores ordering of children.'''
+        if self is other:
+            return True
+        if _hashes_differ(self, other, False):
+            return False
         if self.value != other.value:
             return False
         edges = set(self.key_iter())
@@ -140,6 +169,177 @@ class GraphNode(Graphable):
                 return False
         return True
 
+    def content_hash(self, ordered=True):
+        '''Return a hash of the values and structure of this whole graph.
+
+        The hash is a SHA-256 digest (as bytes) of a canonical encoding of the
+        keys and values, in which None, bools, ints, floats, strings, bytes,
+        and lists, tuples, dicts and sets of those are encoded by content. That
+        covers anything loaded from JSON or YAML. For graphs holding only such
+        values, graphs that are all_equals have the same content hash, graphs
+        that are unordered_equals have the same content hash when
+        ordered=False, and equal hashes mean equal graphs.
+
+        >>> g1 = PlainGraphNode(1, [('a', PlainGraphNode(2)), ('b', PlainGraphNode(3))])
+        >>> g2 = PlainGraphNode(1, [('b', PlainGraphNode(3)), ('a', PlainGraphNode(2))])
+        >>> g1.content_hash() == g2.content_hash()
+        False
+        >>> g1.content_hash(ordered=False) == g2.content_hash(ordered=False)
+        True
+
+        Immutable graphs (FrozenGraph and PersistentGraphNode) cache the hash of
+        every node once it's been computed, so later calls, and all_equals()
+        and unordered_equals(), can reuse it. Other graphs are rehashed on each
+        call, though shared nodes are only hashed once per call. Values of other
+        types are encoded by hash(), or by just their type if unhashable, so
+        graphs holding them can collide, and equal values of different types,
+        like Decimal(1) and 1, get different hashes. Graphs with cycles can't
+        be hashed.
+        '''
+        cached = self._cached_hash(ordered)
+        if cached is not None:
+            return cached
+        # Iterative post-order walk. done maps id(node) to (node, hash); the
+        # node is kept so that its id can't be reused. Nodes on the current
+        # path are in active.
+        done = {}
+        active = set()
+        stack = [(self, None)]
+        while stack:
+            node, edges = stack.pop()
+            if id(node) in done:
+                continue
+            if edges is None:
+                if id(node) in active:
+                    raise ValueError("Cannot hash a graph with cycles")
+                active.add(id(node))
+                edges = list(node.edge_iter())
+                stack.append((node, edges))
+                for _, child in reversed(edges):
+                    if id(child) not in done:
+                        cached = child._cached_hash(ordered)
+                        if cached is None:
+                            stack.append((child, None))
+                        else:
+                            done[id(child)] = (child, cached)
+                continue
+            active.discard(id(node))
+            result = _combine_hashes(node.value,
+                [(key, done[id(child)][1]) for key, child in edges], ordered)
+            node._store_hash(ordered, result)
+            done[id(node)] = (node, result)
+        return done[id(self)][1]
+
+    def _cached_hash(self, ordered):
+        # Return this node's content hash if it's already known, else None
+        return None
+
+    def _store_hash(self, ordered, value):
+        # Remember this node's content hash, if it's safe to do so
+        pass
+
+# The first byte of every content hash says whether all the values below the
+# node were encoded by content, so that the hash can stand in for the graph.
+_BY_CONTENT = b'c'
+_BY_HASH = b'h'
+
+_INT_TYPES = (bool, int) if sys.version >= '3' else (bool, int, long)
+
+def _encode_value(value, out, exact=False):
+    '''Append a canonical encoding of value to the list of bytes out.
+
+    Values that compare equal get the same encoding, so 1, 1.0 and True all
+    encode alike. If exact is True, numbers are encoded by type and repr
+    instead, so only identical-looking values of the same types, all the way
+    down, encode alike. Returns False if some part of value was encoded by
+    hash() or by type rather than by content.
+    '''
+    kind = type(value)
+    if value is None:
+        out.append(b'N')
+    elif exact and (kind in _INT_TYPES or kind is float):
+        out.append(('%s%r;' % (kind.__name__, value)).encode('ascii'))
+    elif kind in _INT_TYPES or (kind is float and value.is_integer()):
+        out.append(('i%d;' % value).encode('ascii'))
+    elif kind is float:
+        out.append(('f%r;' % value).encode('ascii'))
+    elif kind is unicode or kind is bytes:
+        data = value.encode('utf-8') if kind is unicode else value
+        tag = 's' if kind is unicode else 'b'
+        out.append(('%s%d:' % (tag, len(data))).encode('ascii'))
+        out.append(data)
+    elif kind is list or kind is tuple:
+        out.append(('%s%d;' % ('l' if kind is list else 't', len(value)))
+            .encode('ascii'))
+        by_content = True
+        for item in value:
+            by_content = _encode_value(item, out, exact) and by_content
+        return by_content
+    elif kind is dict or kind is set or kind is frozenset:
+        # Unordered, so encode each item separately and sort the encodings
+        items = []
+        by_content = True
+        for item in (value.items() if kind is dict else value):
+            parts = []
+            if kind is dict:
+                by_content = _encode_value(item[0], parts, exact) and by_content
+                by_content = _encode_value(item[1], parts, exact) and by_content
+            else:
+                by_content = _encode_value(item, parts, exact) and by_content
+            items.append(b''.join(parts))
+        items.sort()
+        out.append(('%s%d;' % ('d' if kind is dict else 'S', len(items)))
+            .encode('ascii'))
+        out.extend(items)
+        return by_content
+    else:
+        try:
+            out.append(('h%d;' % hash(value)).encode('ascii'))
+        except TypeError:
+            name = (kind.__module__ + '.' + kind.__name__).encode('utf-8')
+            out.append(('u%d:' % len(name)).encode('ascii'))
+            out.append(name)
+        return False
+    return True
+
+def _combine_hashes(value, child_hashes, ordered):
+    out = []
+    by_content = _encode_value(value, out)
+    children = []
+    for key, child_hash in child_hashes:
+        by_content = by_content and child_hash[:1] == _BY_CONTENT
+        key = key.encode('utf-8')
+        children.append(b''.join([('%d:' % len(key)).encode('ascii'), key,
+            child_hash]))
+    if not ordered:
+        children.sort()
+    out.append(('c%d;' % len(children)).encode('ascii'))
+    out.extend(children)
+    prefix = _BY_CONTENT if by_content else _BY_HASH
+    return prefix + hashlib.sha256(b''.join(out)).digest()
+
+def _hashed_by_content(content_hash):
+    '''Whether a content hash covers only values that were encoded by content.
+
+    Only then is the hash collision-resistant.
+    '''
+    return content_hash[:1] == _BY_CONTENT
+
+def _hashes_differ(g1, g2, ordered):
+    # Only hashes computed by content are equal for every pair of equal graphs
+    h1 = g1._cached_hash(ordered)
+    if h1 is None or not _hashed_by_content(h1):
+        return False
+    h2 = g2._cached_hash(ordered)
+    return h2 is not None and _hashed_by_content(h2) and h1 != h2
+
+def _check_edges(edges):
+    for key, child in edges:
+        if not isinstance(key, basestring):
+            raise ValueError("Graph key is not a string: {}".format(key))
+        if not isinstance(child, GraphNode):
+            raise ValueError("Graph child is not a GraphNode: {}".format(child))
+
 class PlainGraphNode(GraphNode):
     '''Implementation of GraphNode using an OrderedDict.
 
@@ -162,6 +362,10 @@ class PlainGraphNode(GraphNode):
         ...
     ValueError: Graph key is not a string: 1
 
+    Pickling a node pickles the whole graph below it as a few flat tables, so
+    it works on graphs of any depth, and shared nodes and cycles are rebuilt as
+    they were. Only sharing within a single node's graph is kept, though:
+    pickling [g, g['foo']] gives two separate copies of g['foo'].
     '''
     __slots__ = ('value', '_edges')
     def __init__(self, value=None, edges=(), **kwargs):
@@ -176,15 +380,24 @@ class PlainGraphNode(GraphNode):
         self._check_sanity()
 
     def _check_sanity(self):
-        for key, child in self.edge_iter():
-            if not isinstance(key, basestring):
-                raise ValueError("Graph key is not a string: {}".format(key))
-            if not isinstance(child, GraphNode):
-                raise ValueError("Graph child is not a GraphNode: {}".format(child))
+        _check_edges(self.edge_iter())
+
+    def __reduce__(self):
+        # Pickle the whole graph as flat tables instead of one nested object
+        # per node, which would recurse once per level of depth.
+        return _rebuild_graph, _flatten_graph(self)
+
+    def __copy__(self):
+        # copy.copy() would otherwise go through __reduce__ and copy the whole
+        # graph; keep it shallow.
+        return _shallow_copy(self)
 
     def key_iter(self):
         return self._edges.keys()
 
+    def edge_iter(self):
+        return iter(self._edges.items())
+
     def _get_child(self, key):
         return self._edges[key]
 
@@ -256,7 +469,7 @@ class PlainGraphNode(GraphNode):
             return d
         if not isinstance(d, dict):
             return cls(d, [])
-        edges = [(key, cls.build(value))
+        edges = [(intern_key(key), cls.build(value))
             for (key, value) in d.items() if key != '_self']
         return cls(d.get("_self"), edges)
 
@@ -269,7 +482,7 @@ class PlainGraphNode(GraphNode):
     def set_edge(self, key, child):
         '''Set the child for an edge.'''
         assert isinstance(child, GraphNode)
-        self._edges[key] = child
+        self._edges[intern_key(key)] = child
 
     def set_path(self, path, value):
         if isinstance(path, (list, tuple)):
@@ -297,6 +510,246 @@ class PlainGraphNode(GraphNode):
         self.set_path(key, child)
 
 
+def _as_path(path):
+    if isinstance(path, (list, tuple)):
+        return tuple(path)
+    return (path,)
+
+
+class PersistentGraphNode(GraphNode):
+    '''An immutable graph node whose updates return new graphs.
+
+    The constructor is the same as PlainGraphNode's, so you can build these with
+    plain_copy(g, cls=PersistentGraphNode) or from_dict(d, PersistentGraphNode).
+    But instead of changing the graph in place, set_path(), set_value() and
+    pop_path() return a new root. Only the nodes along the changed path are
+    copied; every other subtree is shared with the old version:
+
+    >>> g1 = PersistentGraphNode(0, a=PersistentGraphNode(1),
+    ...     b=PersistentGraphNode(2, c=PersistentGraphNode(3)))
+    >>> g2 = g1.set_path(('b', 'c'), PersistentGraphNode(30))
+    >>> g2['b', 'c'].value, g1['b', 'c'].value
+    (30, 3)
+    >>> g2['a'] is g1['a']
+    True
+    >>> g3 = g2.set_value('a', 10).pop_path('b')
+    >>> list(g3.key_iter()), g3['a'].value, g2['a'].value
+    (['a'], 10, 1)
+
+    Memory thus grows with the number of edits rather than with the size of the
+    graph times the number of versions. The children of a persistent node
+    should themselves be persistent; otherwise they could be changed in place
+    and the change would show up in every version sharing them.
+    '''
+    __slots__ = ('_value', '_edges', '_hashes')
+    def __init__(self, value=None, edges=(), **kwargs):
+        self._edges = OrderedDict(edges, **kwargs)
+        self._value = value
+        self._hashes = None
+        _check_edges(self.edge_iter())
+
+    def __reduce__(self):
+        return _rebuild_graph, _flatten_graph(self)
+
+    def __copy__(self):
+        return _shallow_copy(self)
+
+    @classmethod
+    def _from_parts(cls, value, edges):
+        node = cls.__new__(cls)
+        node._value = value
+        node._edges = edges
+        node._hashes = None
+        return node
+
+    def _cached_hash(self, ordered):
+        if self._hashes is None:
+            return None
+        return self._hashes.get(ordered)
+
+    def _store_hash(self, ordered, value):
+        if self._hashes is None:
+            self._hashes = {}
+        self._hashes[ordered] = value
+
+    @property
+    def value(self):
+        return self._value
+
+    def key_iter(self):
+        return self._edges.keys()
+
+    def edge_iter(self):
+        return iter(self._edges.items())
+
+    def _get_child(self, key):
+        return self._edges[key]
+
+    def set_edge(self, key, child):
+        '''Return a copy of this node with the edge key leading to child.'''
+        assert isinstance(child, GraphNode)
+        edges = OrderedDict(self._edges)
+        edges[intern_key(key)] = child
+        return self._from_parts(self._value, edges)
+
+    def add_edge(self, key, child):
+        '''Like set_edge, but raise ValueError if this key is already used.'''
+        if key in self._edges:
+            raise ValueError("Duplicate key: {0}".format(key))
+        return self.set_edge(key, child)
+
+    def pop_edge(self, key):
+        '''Return a copy of this node without the edge key.
+
+        Raises KeyError if there's no such edge.
+        '''
+        edges = OrderedDict(self._edges)
+        del edges[key]
+        return self._from_parts(self._value, edges)
+
+    def with_value(self, value):
+        '''Return a copy of this node with a different value.'''
+        return self._from_parts(value, self._edges)
+
+    def set_path(self, path, child):
+        '''Return a new graph with the node at path replaced by child.'''
+        path = _as_path(path)
+        if not path:
+            raise ValueError("Cannot set value of empty path!")
+        return self._update(path[:-1], lambda node: node.set_edge(path[-1], child))
+
+    def set_value(self, path, value):
+        '''Return a new graph with the value at path replaced by value.'''
+        return self._update(_as_path(path), lambda node: node.with_value(value))
+
+    def pop_path(self, path):
+        '''Return a new graph without the node at path (or anything below it).'''
+        path = _as_path(path)
+        if not path:
+            raise ValueError("Cannot remove the root!")
+        return self._update(path[:-1], lambda node: node.pop_edge(path[-1]))
+
+    def _update(self, path, fn):
+        # Replace the node at path with fn(node), then copy each of its
+        # ancestors to point to the new node.
+        nodes = [self]
+        for i, key in enumerate(path):
+            try:
+                nodes.append(nodes[-1].get_child(key))
+            except KeyError:
+                raise KeyError(*path[:i+1])
+        new_node = fn(nodes.pop())
+        for key in reversed(path):
+            new_node = nodes.pop().set_edge(key, new_node)
+        return new_node
+
+
+# Slots handled directly by _flatten_graph, or not worth pickling
+_CORE_SLOTS = frozenset(['value', '_value', '_edges', '_hashes', '__weakref__',
+    '__dict__'])
+_extra_slots_cache = {}
+
+def _extra_state(node):
+    cls = type(node)
+    names = _extra_slots_cache.get(cls)
+    if names is None:
+        names = _extra_slots_cache[cls] = [name for c in cls.__mro__
+            for name in getattr(c, '__slots__', ()) if name not in _CORE_SLOTS]
+    state = dict((name, getattr(node, name)) for name in names
+        if hasattr(node, name))
+    state.update(getattr(node, '__dict__', ()))
+    return state
+
+def _shallow_copy(node):
+    '''Copy node's attributes, but not its edges or children, to a new node.'''
+    cls = type(node)
+    new = cls.__new__(cls)
+    for name in set(name for c in cls.__mro__
+            for name in getattr(c, '__slots__', ())):
+        if name not in ('__weakref__', '__dict__') and hasattr(node, name):
+            setattr(new, name, getattr(node, name))
+    if hasattr(node, '__dict__'):
+        new.__dict__.update(node.__dict__)
+    return new
+
+def _flatten_graph(root):
+    '''Describe the graph under root as flat tables, for pickling.
+
+    Every PlainGraphNode or PersistentGraphNode reachable from root gets one
+    entry, however many times it appears, so shared nodes stay shared and
+    cycles are fine. Any other kind of node is stored whole, and pickled as
+    usual. Returns (classes, kinds, values, shapes, keys, targets, extras): node
+    i is classes[kinds[i]] (or values[i] itself if kinds[i] is -1), has value
+    values[i] and shapes[i] edges, which are the next shapes[i] entries of keys
+    and targets (the indices of the children); extras maps node indices to any
+    other attributes they have.
+    '''
+    classes, class_ids = [], {}
+    kinds, values, shapes, keys, targets = [], [], [], [], []
+    extras = {}
+    index = {id(root): 0}
+    nodes = [root]
+    for node in nodes:
+        cls = type(node)
+        class_id = class_ids.get(cls)
+        if class_id is None:
+            if issubclass(cls, (PlainGraphNode, PersistentGraphNode)):
+                class_id = len(classes)
+                classes.append(cls)
+            else:
+                class_id = -1
+            class_ids[cls] = class_id
+        if class_id == -1:
+            kinds.append(-1)
+            values.append(node)
+            shapes.append(0)
+            continue
+        state = _extra_state(node)
+        if state:
+            extras[len(kinds)] = state
+        kinds.append(class_id)
+        values.append(node.value)
+        shapes.append(len(node._edges))
+        for key, child in node._edges.items():
+            j = index.get(id(child))
+            if j is None:
+                j = index[id(child)] = len(nodes)
+                nodes.append(child)
+            keys.append(key)
+            targets.append(j)
+    return classes, kinds, values, shapes, keys, targets, extras
+
+def _rebuild_graph(classes, kinds, values, shapes, keys, targets, extras):
+    '''Inverse of _flatten_graph; returns the root.'''
+    persistent = [issubclass(cls, PersistentGraphNode) for cls in classes]
+    nodes = []
+    for kind, value in zip(kinds, values):
+        if kind == -1:
+            nodes.append(value)
+            continue
+        cls = classes[kind]
+        node = cls.__new__(cls)
+        if persistent[kind]:
+            node._value = value
+            node._hashes = None
+        else:
+            node.value = value
+        nodes.append(node)
+    for i, state in extras.items():
+        for name, value in state.items():
+            setattr(nodes[i], name, value)
+    # Edges go in once every node exists, so cycles work out.
+    start = 0
+    for node, kind, count in zip(nodes, kinds, shapes):
+        if kind == -1:
+            continue
+        end = start + count
+        node._edges = OrderedDict(zip(keys[start:end],
+            [nodes[j] for j in targets[start:end]]))
+        start = end
+    return nodes[0]
+
+
 def plain_copy(node, cls=PlainGraphNode):
     '''Convert any graph into a graph made of PlainGraphNodes.
 
@@ -305,9 +758,62 @@ def plain_copy(node, cls=PlainGraphNode):
     You can specify an alternate class instead of PlainGraphNode; the alternate
     must have the same constructor as PlainGraphNode, namely cls(value, edges).
     '''
-    edges = [(key, plain_copy(child, cls)) for (key, child) in node.edge_iter()]
+    edges = [(intern_key(key), plain_copy(child, cls))
+        for (key, child) in node.edge_iter()]
     return cls(node.value, edges)
 
+class HashConsBuilder(object):
+    '''A node constructor that returns one shared node per distinct subtree.
+
+    A HashConsBuilder can be passed anywhere a cls(value, edges) constructor is
+    expected, e.g. as the cls argument to plain_copy(), from_dict() or
+    load_graph(). It keeps a table of every node it has built, keyed on the
+    node's value, edge keys and children; asking it for a node equal to one it
+    already built returns the existing node instead of a new one. Since the
+    graph is built bottom-up, identical subtrees collapse into one shared node:
+
+    >>> from .misc_fns import from_dict
+    >>> defaults = dict(retries=3, timeout=30)
+    >>> g = from_dict(dict(host1=defaults, host2=defaults, host3=dict(retries=3,
+    ...     timeout=60)), cls=HashConsBuilder())
+    >>> g['host1'] is g['host2']
+    True
+    >>> g['host1', 'retries'] is g['host3', 'retries']
+    True
+    >>> g['host1'] is g['host3']
+    False
+
+    Values are compared by an exact encoding of their types and contents, so
+    1, 1.0 and True are kept apart, as are 0.0 and -0.0, and (1,) and (1.0,).
+    Only None, bools, ints, floats, strings, bytes, and lists, tuples, dicts
+    and sets of those can be encoded; nodes with other values are never
+    shared.
+
+    Because shared nodes are the same object, changing one in place changes it
+    everywhere it appears. Treat the result as read-only, or use
+    PersistentGraphNode as cls.
+    '''
+    def __init__(self, cls=PlainGraphNode):
+        self.cls = cls
+        self.table = {}
+
+    def __call__(self, value=None, edges=(), **kwargs):
+        if isinstance(edges, dict):
+            edges = edges.items()
+        edges = list(edges) + list(kwargs.items())
+        encoded = []
+        if not _encode_value(value, encoded, exact=True):
+            return self.cls(value, edges)
+        # The table holds on to every node it returns, and thus to all of their
+        # children, so the ids in the signature stay valid.
+        signature = (b''.join(encoded),
+            tuple((key, id(child)) for key, child in edges))
+        node = self.table.get(signature)
+        if node is None:
+            node = self.table[signature] = self.cls(value, edges)
+        return node
+
+
 def smart_plain_copy(node, cls=PlainGraphNode):
     '''Like plain_copy, but recurring nodes in the source are preserved.
 
@@ -336,6 +842,262 @@ def _smart_plain_copy(node, cls, cache):
     return cache[node]
 
 
+class PathIndex(GraphNode):
+    '''Wrap a graph with a table mapping every path to its node.
+
+    Looking up a path in a normal graph follows one edge at a time. A PathIndex
+    walks the whole graph once when it's created, after which g[path] and
+    path in g are a single dictionary lookup, however deep the path is:
+
+    >>> g = PlainGraphNode.build({'a': {'b': {'c': 'deep value'}}})
+    >>> idx = PathIndex(g)
+    >>> idx['a', 'b', 'c'].value
+    'deep value'
+    >>> idx['a', 'b', 'c'] is g['a', 'b', 'c']
+    True
+
+    Paths can also be given as strings separated by sep (default '/'):
+
+    >>> idx['a/b/c'].value
+    'deep value'
+    >>> 'a/b/nope' in idx
+    False
+
+    In every other respect the index behaves like the graph it wraps, including
+    for paths that aren't listed by key_iter(), which are looked up in the
+    wrapped graph as usual. The nodes returned are the wrapped graph's own.
+
+    The table is built once, so it won't see later changes to the graph; call
+    refresh() after changing it. It holds an entry for every path, so it's best
+    suited to trees and DAGs without much sharing, and never finishes on a
+    graph with cycles.
+    '''
+    __slots__ = ('graph', 'sep', '_nodes')
+    def __init__(self, graph, sep='/'):
+        self.graph = graph
+        self.sep = sep
+        self.refresh()
+
+    def refresh(self):
+        '''Rebuild the table from the current state of the graph.'''
+        nodes = self._nodes = {}
+        stack = [((), self.graph)]
+        while stack:
+            path, node = stack.pop()
+            nodes[path] = node
+            for key, child in node.edge_iter():
+                stack.append((path + (key,), child))
+
+    @property
+    def value(self):
+        return self.graph.value
+
+    def key_iter(self):
+        return self.graph.key_iter()
+
+    def edge_iter(self):
+        return self.graph.edge_iter()
+
+    def _get_child(self, key):
+        return self.graph._get_child(key)
+
+    def _normalize(self, path):
+        if isinstance(path, tuple):
+            return path
+        if isinstance(path, list):
+            return tuple(path)
+        if (path,) in self._nodes or not self.sep:
+            return (path,)
+        if isinstance(path, basestring):
+            return tuple(bit for bit in path.split(self.sep) if bit)
+        return (path,)
+
+    def get_path(self, path, default=Missing):
+        path = self._normalize(path)
+        node = self._nodes.get(path)
+        if node is None:
+            return self.graph.get_path(path, default)
+        return node
+
+    def __contains__(self, path):
+        path = self._normalize(path)
+        return path in self._nodes or path in self.graph
+
+
+class _FrozenStore(object):
+    # Flat storage shared by every node of a FrozenGraph. Nodes are numbered
+    # in breadth-first order, so the children of node i are exactly the nodes
+    # offsets[i] through offsets[i+1]-1. key_ids[j] is the index in keys of the
+    # label of the edge leading to node j, and values[j] is node j's value.
+    # hashes maps ordered (True/False) to a list of every node's content hash,
+    # filled in all at once the first time one is needed. by_key is the pair of
+    # columns from _sort_children, built on the first child lookup.
+    __slots__ = ('offsets', 'key_ids', 'keys', 'key_index', 'values', 'hashes',
+        'by_key')
+    def __init__(self, offsets, key_ids, keys, key_index, values, by_key=None):
+        self.offsets = offsets
+        self.key_ids = key_ids
+        self.keys = keys
+        self.key_index = key_index
+        self.values = values
+        self.hashes = {}
+        self.by_key = by_key
+
+    def child_lookup(self):
+        if self.by_key is None:
+            self.by_key = _sort_children(self.offsets, self.key_ids)
+        return self.by_key
+
+    def content_hashes(self, ordered):
+        if ordered not in self.hashes:
+            # Children always come after their parents, so a single backwards
+            # pass sees every child before its parent.
+            offsets, key_ids, keys = self.offsets, self.key_ids, self.keys
+            hashes = [None] * len(self.values)
+            for i in range(len(self.values) - 1, -1, -1):
+                hashes[i] = _combine_hashes(self.values[i],
+                    [(keys[key_ids[j]], hashes[j])
+                        for j in range(offsets[i], offsets[i+1])], ordered)
+            self.hashes[ordered] = hashes
+        return self.hashes[ordered]
+
+
+def _sort_children(offsets, key_ids):
+    '''Index every node's children by key id, for _find_child.
+
+    Returns two columns in the same numbering as key_ids. Within each node's
+    range of children, positions lists the children ordered by key id, and
+    sorted_ids[j] is key_ids[positions[j]]. The edges themselves keep their
+    order.
+    '''
+    positions = array('l', range(len(key_ids)))
+    for i in range(len(offsets) - 1):
+        lo, hi = offsets[i], offsets[i+1]
+        if hi - lo > 1:
+            positions[lo:hi] = array('l',
+                sorted(range(lo, hi), key=key_ids.__getitem__))
+    sorted_ids = array('i', [key_ids[j] for j in positions])
+    return sorted_ids, positions
+
+def _find_child(offsets, sorted_ids, positions, index, key_id):
+    '''Return the position of node index's child with key_id, or -1.
+
+    This is a binary search of the node's range of the _sort_children columns,
+    so it takes time logarithmic in the node's number of children.
+    '''
+    lo, hi = offsets[index], offsets[index+1]
+    j = bisect_left(sorted_ids, key_id, lo, hi)
+    if j < hi and sorted_ids[j] == key_id:
+        return positions[j]
+    return -1
+
+
+class FrozenGraph(GraphNode):
+    '''A read-only graph stored in flat arrays instead of one dict per node.
+
+    Use freeze() to build one from any other graph. A frozen graph has the same
+    structure and values as the original, but all of its topology lives in two
+    arrays of ints (child offsets and interned key ids) plus one list of values,
+    so it takes a fraction of the memory of the equivalent PlainGraphNodes.
+
+    >>> g = freeze(PlainGraphNode.build(OrderedDict([
+    ...     ('_self', 'root'),
+    ...     ('a', OrderedDict([('_self', 'A'), ('b', 'B')])),
+    ...     ('c', 'C'),
+    ... ])))
+    >>> g.value
+    'root'
+    >>> list(g.key_iter())
+    ['a', 'c']
+    >>> g['a', 'b'].value
+    'B'
+    >>> g['a', 'nope']
+    Traceback (most recent call last):
+        ...
+    KeyError: ('a', 'nope')
+
+    The nodes are lightweight views into the shared arrays, created as they're
+    requested, so as with other dynamic graphs g['a'] is not g['a']. Frozen
+    graphs can't be modified; use plain_copy() to get a mutable copy.
+
+    The first lookup by key sorts each node's children by key id, in two more
+    int arrays. From then on, g[key] is a binary search taking time
+    logarithmic in the node's number of children.
+
+    Making a view per visited node makes generic traversals (edge_iter, walk)
+    slower than over PlainGraphNodes; iter_events reads the arrays directly
+    instead, and is somewhat faster.
+    '''
+    __slots__ = ('_store', '_index')
+    def __init__(self, store, index=0):
+        self._store = store
+        self._index = index
+
+    @property
+    def value(self):
+        return self._store.values[self._index]
+
+    def key_iter(self):
+        store = self._store
+        keys = store.keys
+        lo, hi = store.offsets[self._index], store.offsets[self._index+1]
+        return [keys[k] for k in store.key_ids[lo:hi]]
+
+    def edge_iter(self):
+        store = self._store
+        keys, key_ids = store.keys, store.key_ids
+        for j in range(store.offsets[self._index], store.offsets[self._index+1]):
+            yield keys[key_ids[j]], FrozenGraph(store, j)
+
+    def _get_child(self, key):
+        store = self._store
+        key_id = store.key_index.get(key)
+        if key_id is None:
+            raise KeyError(key)
+        sorted_ids, positions = store.child_lookup()
+        j = _find_child(store.offsets, sorted_ids, positions, self._index, key_id)
+        if j < 0:
+            raise KeyError(key)
+        return FrozenGraph(store, j)
+
+    def content_hash(self, ordered=True):
+        return self._store.content_hashes(ordered)[self._index]
+
+    def _cached_hash(self, ordered):
+        hashes = self._store.hashes.get(ordered)
+        if hashes is None:
+            return None
+        return hashes[self._index]
+
+def freeze(node):
+    '''Convert any graph into a FrozenGraph in a single breadth-first pass.
+
+    Like plain_copy(), this duplicates nodes that appear more than once and
+    will never finish on a graph with cycles.
+    '''
+    if isinstance(node, FrozenGraph) and node._index == 0:
+        return node
+    keys = []
+    key_index = {}
+    values = [node.value]
+    offsets = array('l')
+    key_ids = array('i', [-1])
+    queue = deque([node])
+    while queue:
+        node = queue.popleft()
+        offsets.append(len(values))
+        for key, child in node.edge_iter():
+            key_id = key_index.get(key)
+            if key_id is None:
+                key_id = key_index[key] = len(keys)
+                keys.append(intern_key(key))
+            key_ids.append(key_id)
+            values.append(child.value)
+            queue.append(child)
+    offsets.append(len(values))
+    return FrozenGraph(_FrozenStore(offsets, key_ids, keys, key_index, values))
+
+
 class GraphableGraphNode(GraphNode):
     '''Wrap any Graphable in a GraphNode.
 
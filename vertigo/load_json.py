@@ -0,0 +1,209 @@
+import codecs
+import json
+import numbers
+
+from .graph import PlainGraphNode, intern_key, freeze
+
+class _Object(object):
+    '''A decoded json object, kept as its (key, item) pairs.
+
+    Whether an object becomes a node or stays a plain dict depends on where it
+    ends up - as a child or as a '_self' value - which is only known once its
+    parent is decoded.
+    '''
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+def _to_node(item, cls):
+    '''Turn a decoded json item into a node.
+
+    Lists become nodes with the children '0', '1', '2', etc., as in
+    JsonGraphNode.
+    '''
+    if isinstance(item, _Object):
+        value = None
+        edges = []
+        for key, sub in item.pairs:
+            if key == '_self':
+                value = _to_plain(sub)
+            else:
+                edges.append((intern_key(key), _to_node(sub, cls)))
+        return cls(value, edges)
+    if isinstance(item, list):
+        return cls(None, [(str(i), _to_node(sub, cls))
+            for i, sub in enumerate(item)])
+    return cls(item, [])
+
+def _to_plain(item):
+    '''Turn a decoded json item into what json.loads would have returned.'''
+    if isinstance(item, _Object):
+        return dict((key, _to_plain(sub)) for key, sub in item.pairs)
+    if isinstance(item, list):
+        return [_to_plain(sub) for sub in item]
+    return item
+
+_DECODER = json.JSONDecoder(object_pairs_hook=_Object)
+
+def load_json_graph(string_or_file, cls=PlainGraphNode, frozen=False):
+    '''Load a json document as a Vertigo graph.
+
+    The graph is built from the (key, item) pairs the parser produces, so the
+    intermediate dicts are never created. As with from_dict, the key '_self' holds a node's
+    value; lists become nodes with value None whose children are '0', '1', '2',
+    etc., as in JsonGraphNode.
+
+    >>> from .misc_fns import ascii_tree
+    >>> s = """{
+    ...     "foo": {"_self": 1, "bar": "hello"},
+    ...     "spam": [10, {"eggs": 20}]
+    ... }"""
+    >>> g = load_json_graph(s)
+    >>> print(ascii_tree(g).strip())
+    root: None
+      +--foo: 1
+      |  +--bar: 'hello'
+      +--spam: None
+         +--0: 10
+         +--1: None
+            +--eggs: 20
+
+    Pass frozen=True to get a FrozenGraph instead:
+
+    >>> load_json_graph(s, frozen=True)['spam', '1', 'eggs'].value
+    20
+
+    A '_self' that holds an object or a list is loaded as the plain dict or
+    list, exactly as from_dict(json.loads(...)) would see it:
+
+    >>> load_json_graph('{"_self": {"a": [1, {"b": 2}]}}').value
+    {'a': [1, {'b': 2}]}
+    '''
+    if hasattr(string_or_file, 'read'):
+        string_or_file = string_or_file.read()
+    if isinstance(string_or_file, bytes):
+        string_or_file = string_or_file.decode('utf-8')
+    graph = _to_node(_DECODER.decode(string_or_file), cls)
+    if frozen:
+        graph = freeze(graph)
+    return graph
+
+_NUMBER_CHARS = frozenset('.eE+-0123456789')
+
+def _is_number(item):
+    return isinstance(item, numbers.Number) and not isinstance(item, bool)
+
+class _Reader(object):
+    '''A growing text buffer over a file, for decoding one item at a time.'''
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        '''Append to the buffer; returns False at the end of the file.
+
+        Reads at least as much again as is buffered, so that an item which is
+        decoded over and over as it grows costs linear time overall.
+        '''
+        if self.eof:
+            return False
+        chunk = self.fp.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        if isinstance(chunk, bytes):
+            chunk = self.utf8.decode(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''Skip whitespace and return the next character, or '' at the end.'''
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.read_more():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError("Expected one of {!r} at offset {} of buffer, got {!r}"
+                .format(chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def decode(self, decoder):
+        self.peek()
+        while True:
+            try:
+                item, end = decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            # A number that runs to the end of the buffer, or stops just
+            # before a fraction or exponent that was cut off (e.g. '2.' or
+            # '-3e'), might continue in the next chunk.
+            if (_is_number(item) and (end == len(self.buf)
+                    or self.buf[end] in _NUMBER_CHARS) and self.read_more()):
+                continue
+            self.pos = end
+            return item
+
+def iter_json_graph(fp, cls=PlainGraphNode, chunk_size=1 << 16):
+    '''Load a large json document from a file one top-level item at a time.
+
+    Yields (key, node) for each member of the top-level object, or for each
+    item of a top-level list, using the keys '0', '1', '2', etc. Only the
+    item being parsed is held in memory, so this works on documents far bigger
+    than memory as long as no single item is.
+
+    >>> import io
+    >>> fp = io.StringIO(u'{"_self": "root", "a": {"b": 1}, "c": [2, 3]}')
+    >>> items = list(iter_json_graph(fp, chunk_size=4))
+    >>> [key for key, node in items]
+    ['_self', 'a', 'c']
+    >>> items[0][1]
+    'root'
+    >>> items[1][1]['b'].value
+    1
+    >>> [child.value for child in items[2][1].child_iter()]
+    [2, 3]
+
+    As the example shows, a top-level '_self' is yielded as the plain value
+    rather than as a node.
+
+    fp may be opened in text or binary mode; bytes are decoded as UTF-8.
+    '''
+    reader = _Reader(fp, chunk_size)
+    close = {'{': '}', '[': ']'}[reader.expect('{[')]
+    index = 0
+    if reader.peek() == close:
+        return
+    while True:
+        if close == '}':
+            if reader.peek() != '"':
+                raise ValueError("Expected a key at offset {} of buffer"
+                    .format(reader.pos))
+            key = reader.decode(_DECODER)
+            reader.expect(':')
+            item = reader.decode(_DECODER)
+            if key == '_self':
+                yield key, _to_plain(item)
+            else:
+                yield intern_key(key), _to_node(item, cls)
+        else:
+            yield str(index), _to_node(reader.decode(_DECODER), cls)
+            index += 1
+        if reader.expect(',' + close) == close:
+            return
@@ -6,18 +6,12 @@ import yaml.constructor
 from .merge_fns import Omit
 from .graph import GraphNode, PlainGraphNode, plain_copy
 
-class VertigoYAMLLoader(yaml.Loader):
+class _GraphConstructor(object):
     """
-    A YAML loader that loads ordered dictionaries and !Omit as vertigo.Omit
+    Mixin for yaml loaders that builds ordered PlainGraphNodes from mappings
+    and loads !Omit as vertigo.Omit
     Partly based on http://stackoverflow.com/questions/5121931/in-python-how-can-you-load-yaml-mappings-as-ordereddicts
     """
-    def __init__(self, *args, **kwargs):
-        yaml.Loader.__init__(self, *args, **kwargs)
-
-        self.add_constructor(u'tag:yaml.org,2002:map', type(self).construct_plain_graph)
-        self.add_constructor(u'tag:yaml.org,2002:omap', type(self).construct_plain_graph)
-        self.add_constructor(u'!Omit', lambda *args, **kwargs: Omit)
-
     def construct_plain_graph(self, node):
         graph = PlainGraphNode()
         yield graph
@@ -50,7 +44,26 @@ class VertigoYAMLLoader(yaml.Loader):
             mapping[key] = value
         return mapping
 
-def load_graph(string_or_file, cls=PlainGraphNode):
+    @classmethod
+    def register_constructors(cls):
+        cls.add_constructor(u'tag:yaml.org,2002:map', cls.construct_plain_graph)
+        cls.add_constructor(u'tag:yaml.org,2002:omap', cls.construct_plain_graph)
+        cls.add_constructor(u'!Omit', lambda *args, **kwargs: Omit)
+
+class VertigoYAMLLoader(_GraphConstructor, yaml.Loader):
+    """A pure-Python YAML loader that builds Vertigo graphs."""
+VertigoYAMLLoader.register_constructors()
+
+if getattr(yaml, '__with_libyaml__', False):
+    class VertigoYAMLCLoader(_GraphConstructor, yaml.CLoader):
+        """VertigoYAMLLoader, but with libyaml's much faster parser."""
+    VertigoYAMLCLoader.register_constructors()
+    DefaultLoader = VertigoYAMLCLoader
+else: # pragma: no cover
+    VertigoYAMLCLoader = None
+    DefaultLoader = VertigoYAMLLoader
+
+def load_graph(string_or_file, cls=PlainGraphNode, Loader=None):
     '''Load a yaml file as a Vertigo graph.
 
     >>> from .misc_fns import ascii_tree
@@ -80,8 +93,16 @@ def load_graph(string_or_file, cls=PlainGraphNode):
     >>> g['bar', 'hi'].value
     'hi'
 
+    By default this uses libyaml's parser if PyYAML was built with it, and the
+    pure-Python one otherwise. Pass Loader=VertigoYAMLLoader to force the
+    latter; both produce the same graphs.
+
+    >>> load_graph(s, Loader=VertigoYAMLLoader).all_equals(load_graph(s))
+    True
     '''
-    graph = yaml.load(string_or_file, Loader=VertigoYAMLLoader)
+    if Loader is None:
+        Loader = DefaultLoader
+    graph = yaml.load(string_or_file, Loader=Loader)
     if cls is not PlainGraphNode:
         graph = plain_copy(graph, cls=cls)
     return graph
@@ -7,12 +7,19 @@ try: # pragma: no cover
 except ImportError: # pragma: no cover
     from io import StringIO
 from collections import OrderedDict
+import sys
+try: # pragma: no cover
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
 
-from .graph import GraphNode, PlainGraphNode, plain_copy, Missing
+from .graph import GraphNode, PlainGraphNode, plain_copy, Missing, intern_key
+from .graph import FrozenGraph, _FrozenStore, HashConsBuilder
 from .walker import bottom_up
 from .wrappers import MapWrapper
 
-@bottom_up
+# Path-dependent, so each path must get its own node
+@bottom_up(memoize=False)
 def make_path_graph(_value, path, children, _pre, cls=PlainGraphNode):
     '''Return a graph with the same structure whose values are their paths.
 
@@ -47,9 +54,120 @@ def map(graph, fn, cls=PlainGraphNode):
     return plain_copy(imap(graph, fn=fn), cls=cls)
 
 
-@bottom_up
-def replace(_value, path, children, _pre, source_graph, default_value=Missing,
-    cls=PlainGraphNode):
+def vmap(graph, fn, cls=None):
+    '''Like map(), but applies fn to all of the graph's numbers at once.
+
+    The int and float values are gathered into NumPy arrays in depth-first
+    order - one of ints and one of floats, so that ints stay ints - fn is
+    called once on each array, and the results are scattered back into a new
+    graph with the same structure. All other values,
+    such as the None held by interior nodes, strings and bools, are copied
+    through unchanged. This is much faster than map() when fn is a ufunc or
+    other array function:
+
+    >>> g = from_dict(OrderedDict([('_self', 1), ('a', 2), ('b', OrderedDict([
+    ...     ('_self', 3), ('c', 4)])), ('d', OrderedDict([('e', 'five')]))]))
+    >>> print(ascii_tree(vmap(g, lambda values: values * 10)))
+    root: 10
+      +--a: 20
+      +--b: 30
+      |  +--c: 40
+      +--d: None
+         +--e: 'five'
+
+    fn must return a sequence with one result per number. If NumPy isn't
+    installed, fn is called on each number in turn instead, so it should be
+    written to work on both arrays and single values. The same goes for ints
+    too big for int64, which are passed one at a time (as floats, if fn
+    raises TypeError on the int itself, as ufuncs do).
+
+    The result is made of cls nodes, which defaults to PlainGraphNode. If graph
+    is the root of a FrozenGraph and cls isn't specified, the result is a
+    FrozenGraph that shares all of the original's structure arrays and only
+    has a new list of values.
+    '''
+    if isinstance(graph, FrozenGraph) and graph._index == 0 and cls is None:
+        store = graph._store
+        values = _vapply(fn, store.values)
+        return FrozenGraph(_FrozenStore(store.offsets, store.key_ids,
+            store.keys, store.key_index, values, store.by_key))
+    if cls is None:
+        cls = PlainGraphNode
+    # Gather values and edge keys in depth-first order
+    values = []
+    shapes = []
+    stack = [graph]
+    while stack:
+        node = stack.pop()
+        values.append(node.value)
+        edges = list(node.edge_iter())
+        shapes.append([key for key, _ in edges])
+        stack.extend(child for _, child in reversed(edges))
+    return _build_preorder(_vapply(fn, values), shapes, cls)
+
+def _build_preorder(values, shapes, cls):
+    '''Build a graph of cls nodes from its values and keys in preorder.
+
+    values[i] is the value of the ith node in depth-first preorder, and
+    shapes[i] lists its edge keys. The nodes are built in reverse, so that each
+    node's children are the most recently built nodes on the stack, and the
+    root is returned.
+    '''
+    built = []
+    for value, keys in zip(reversed(values), reversed(shapes)):
+        children = [built.pop() for _ in keys]
+        built.append(cls(value, OrderedDict(zip(keys, children))))
+    return built[0]
+
+_NUMBER_TYPES = (int, float) if sys.version >= '3' else (int, long, float)
+
+_INT64_MIN = -1 << 63
+_INT64_MAX = (1 << 63) - 1
+
+def _vapply(fn, values):
+    # Only real numbers go through fn; bool is an int subclass, so check the
+    # exact type.
+    positions = [i for i, value in enumerate(values)
+        if type(value) in _NUMBER_TYPES]
+    values = list(values)
+    if numpy is None:
+        for i in positions:
+            values[i] = fn(values[i])
+        return values
+    # One array of ints and floats would turn the ints into floats, and an int
+    # outside int64 would make an object array that most ufuncs reject, so the
+    # ints and floats get an array each and the huge ints are done one by one.
+    ints, floats, huge = [], [], []
+    for i in positions:
+        value = values[i]
+        if type(value) is float:
+            floats.append(i)
+        elif _INT64_MIN <= value <= _INT64_MAX:
+            ints.append(i)
+        else:
+            huge.append(i)
+    for group, dtype in ((ints, numpy.int64), (floats, numpy.float64)):
+        if not group:
+            continue
+        results = fn(numpy.asarray([values[i] for i in group], dtype=dtype))
+        if isinstance(results, numpy.ndarray):
+            results = results.tolist()
+        if len(results) != len(group):
+            raise ValueError("vmap function returned {} results for {} values"
+                .format(len(results), len(group)))
+        for i, result in zip(group, results):
+            values[i] = result
+    for i in huge:
+        try:
+            values[i] = fn(values[i])
+        except TypeError:
+            # Ufuncs such as numpy.sqrt have no loop for a plain Python int;
+            # give them the nearest float instead.
+            values[i] = fn(float(values[i]))
+    return values
+
+
+def replace(graph, source_graph, default_value=Missing, cls=PlainGraphNode):
     '''Replace each value in the graph with the corresponding value of src_graph
 
     Missing values will be set to default_value, if it is provided, and will
@@ -98,14 +216,44 @@ def replace(_value, path, children, _pre, source_graph, default_value=Missing,
       +--child1: 'New Child1'
       +--child2: 'DEFAULT'
          +--sub1: 'DEFAULT'
+
+    The two graphs are walked together, so each node of source_graph is looked
+    up once from its parent rather than from the root, and this takes time
+    linear in the size of graph however deep it is.
     '''
-    try:
-        value = source_graph[path].value
-    except KeyError:
-        if default_value is Missing:
-            raise
-        value = default_value
-    return cls(value=value, edges=children)
+    if isinstance(graph, dict):
+        graph = PlainGraphNode.build(graph)
+    # Visit graph in preorder alongside the matching source node, which is
+    # Missing below any path source_graph doesn't have. Keys and parent indices
+    # are kept only so a missing path can be reported.
+    values, shapes, keys, parents = [], [], [], []
+    stack = [(graph, source_graph, None, -1)]
+    while stack:
+        node, src, key, parent = stack.pop()
+        if src is Missing:
+            if default_value is Missing:
+                path = []
+                while parent != -1:
+                    path.append(key)
+                    key, parent = keys[parent], parents[parent]
+                raise KeyError(*reversed(path))
+            values.append(default_value)
+        else:
+            values.append(src.value)
+        index = len(keys)
+        keys.append(key)
+        parents.append(parent)
+        edges = list(node.edge_iter())
+        shapes.append([k for k, _ in edges])
+        for k, child in reversed(edges):
+            sub = Missing
+            if src is not Missing:
+                try:
+                    sub = src.get_child(k)
+                except KeyError:
+                    pass
+            stack.append((child, sub, k, index))
+    return _build_preorder(values, shapes, cls)
 
 
 def fill_nones(graph, value):
@@ -344,6 +492,32 @@ def test_subgraph():
     assert g1['x'].value == 'X value'
 
 
+@bottom_up(memoize=True)
+def _dedupe(value, _path, children, _pre, builder):
+    return builder(value, children)
+
+def dedupe(graph, cls=PlainGraphNode):
+    '''Copy a graph, merging all structurally identical subtrees into one.
+
+    Two subtrees are identical if they have equal values and the same edge keys,
+    in the same order, leading to identical subtrees. See HashConsBuilder, which
+    does the actual merging; unlike plain_copy(graph, cls=HashConsBuilder()),
+    dedupe() only visits each distinct node of the input once, so it stays fast
+    on graphs that already share nodes.
+
+    >>> g = from_dict(OrderedDict([
+    ...     ('a', OrderedDict([('x', 1), ('y', 2)])),
+    ...     ('b', OrderedDict([('x', 1), ('y', 2)])),
+    ...     ('c', OrderedDict([('y', 2), ('x', 1)])),
+    ... ]))
+    >>> g2 = dedupe(g)
+    >>> g2.all_equals(g)
+    True
+    >>> g2['a'] is g2['b'], g2['a'] is g2['c'], g2['a', 'x'] is g2['c', 'x']
+    (True, False, True)
+    '''
+    return _dedupe(graph, builder=HashConsBuilder(cls))
+
 # TODO cycle detection?
 def from_dict(d, cls=PlainGraphNode):
     '''Construct a graph from a dictionary.
@@ -415,7 +589,7 @@ def from_dict(d, cls=PlainGraphNode):
         return d
     if not isinstance(d, dict):
         return cls(d, [])
-    edges = [(key, from_dict(value, cls))
+    edges = [(intern_key(key), from_dict(value, cls))
         for (key, value) in d.items() if key != '_self']
     return cls(d.get("_self"), edges)
 
@@ -541,41 +715,75 @@ def from_flat(d, cls=PlainGraphNode, sep='/'):
     Traceback (most recent call last):
         ...
     ValueError: Duplicate path 'foo/bar'
+
+    Every node, including the ones only implied by longer paths, is built with
+    cls(value, edges).
+
+    The keys are first gathered into a trie of plain dicts, so a prefix shared
+    by many keys is only looked up once per key in a dict rather than resolved
+    through the graph, and the nodes are then built bottom-up in one pass.
     '''
-    root = cls()
+    # Each trie entry is [value, OrderedDict of child entries].
+    trie = [Missing, OrderedDict()]
     for key, val in d.items():
         if sep and not isinstance(key, (list, tuple)):
             path = [bit for bit in key.split(sep) if bit]
         else:
             path = key
-        target = root
+        entry = trie
         for bit in path:
-            if bit not in target:
-                new_node = PlainGraphNode()
-                target.add_edge(bit, new_node)
-            target = target[bit]
-        if target.value:
-            raise ValueError("Duplicate path '{}'".format(sep.join(path)))
-        target.value = val
-    return root
-
-def _tf_helper(graph, prefix, minimize, sep, ordered):
-    if ordered:
-        d = OrderedDict()
-        d[prefix] = None
-    else:
-        d = {}
-    for key, child in graph.edge_iter():
-        if sep:
-            sub_prefix = sep.join([prefix, key]) if prefix else key
-        else:
-            sub_prefix = prefix + (key,) if prefix else (key,)
-        d.update(_tf_helper(child, sub_prefix, minimize, sep, ordered))
-    if graph.value is not None or not minimize or not d:
-        d[prefix] = graph.value
-    elif ordered:
-        del d[prefix]
-    return d
+            children = entry[1]
+            sub = children.get(bit)
+            if sub is None:
+                sub = children[intern_key(bit)] = [Missing, OrderedDict()]
+            entry = sub
+        if entry[0] is not Missing:
+            raise ValueError("Duplicate path '{}'".format(
+                (sep or '/').join(path)))
+        entry[0] = val
+    # List the entries in preorder, then build bottom-up.
+    values, shapes = [], []
+    stack = [trie]
+    while stack:
+        value, children = stack.pop()
+        values.append(None if value is Missing else value)
+        shapes.append(children)
+        stack.extend(reversed(children.values()))
+    return _build_preorder(values, shapes, cls)
+
+def iter_flat(graph, minimize=False, sep='/'):
+    '''Yield the (path, value) pairs of to_flat one at a time.
+
+    The pairs come in preorder, following the order of the edges, and the
+    arguments mean the same as for to_flat:
+
+    >>> g = from_flat(OrderedDict([
+    ...     ('foo/bar', "A bar value"),
+    ...     ('foo/baz/qux', 12),
+    ...     ('spam', None),
+    ... ]))
+    >>> for path, value in iter_flat(g, minimize=True):
+    ...     print(path, value)
+    foo/bar A bar value
+    foo/baz/qux 12
+    spam None
+
+    Each node is visited once and nothing is accumulated, so this is a good way
+    to stream a large graph out to a file or a key-value store.
+    '''
+    stack = [('' if sep else (), graph)]
+    while stack:
+        prefix, node = stack.pop()
+        value = node.value
+        edges = list(node.edge_iter())
+        if value is not None or not minimize or not edges:
+            yield prefix, value
+        for key, child in reversed(edges):
+            if sep:
+                sub_prefix = sep.join([prefix, key]) if prefix else key
+            else:
+                sub_prefix = prefix + (key,)
+            stack.append((sub_prefix, child))
 
 def to_flat(graph, minimize=False, sep='/', ordered=False):
     '''The inverse of from_flat.
@@ -639,9 +847,14 @@ def to_flat(graph, minimize=False, sep='/', ordered=False):
     >>> to_flat(g, ordered=True)
     OrderedDict([('', None), ('foo', None), ('foo/bar', 'A bar value'), ('foo/baz', None), ('foo/baz/qux', 12), ('spam', None)])
     >>> to_flat(g, minimize=True, ordered=True)
-    OrderedDict([('foo/bar', 'A bar value'), ('foo/baz/qux', 12)])
+    OrderedDict([('foo/bar', 'A bar value'), ('foo/baz/qux', 12), ('spam', None)])
+
+    The root's path is '' if sep is given, and () if it's None. This is built
+    from iter_flat(), which you can use directly to avoid building the dict.
     '''
-    return _tf_helper(graph, '', minimize, sep, ordered)
+    d = OrderedDict() if ordered else {}
+    d.update(iter_flat(graph, minimize, sep))
+    return d
 
 class AppliedGraphNode(GraphNode):
     '''GraphNode that applies a function graph to another graph.
@@ -0,0 +1,139 @@
+from .graph import PlainGraphNode, plain_copy
+from .merge_fns import imerge
+from .misc_fns import AppliedGraphNode
+from .wrappers import MapWrapper, SortedWrapper, EdgeRestriction, fuse
+
+# Merge functions for which restricting the zipped root's keys gives the same
+# result as restricting each input's keys first
+_DISTRIBUTIVE = frozenset(['first', 'last', 'union', 'intersection'])
+
+class Pipeline(object):
+    '''A chain of graph operations, run lazily and all at once.
+
+    Use pipeline() to start one. Each method returns a new Pipeline with one
+    more step; nothing happens until lazy() or materialize() is called. See
+    pipeline() for details.
+    '''
+    __slots__ = ('source', 'steps')
+    def __init__(self, source, steps=()):
+        self.source = source
+        self.steps = tuple(steps)
+
+    def _then(self, *step):
+        return Pipeline(self.source, self.steps + (step,))
+
+    def map(self, fn):
+        '''Pass every value through fn, as in imap().'''
+        return self._then('map', fn)
+
+    def apply(self, fn_graph):
+        '''Apply a graph of functions to the values, as in apply().'''
+        return self._then('apply', fn_graph)
+
+    def fill_nones(self, value):
+        '''Replace every None with value, as in fill_nones().'''
+        return self.map(lambda v: value if v is None else v)
+
+    def overlay(self, *graphs, **kwargs):
+        '''Overlay the graph so far on top of graphs, as in overlay().
+
+        The graphs may themselves be Pipelines. Accepts overlay()'s merge_fn
+        (default 'first') and reversed kwargs.
+        '''
+        merge_fn = kwargs.pop('merge_fn', 'first')
+        reverse = kwargs.pop('reversed', False)
+        if kwargs:
+            raise TypeError("Unexpected kwargs: {}".format(', '.join(kwargs)))
+        graphs = tuple(g.lazy() if isinstance(g, Pipeline) else g
+            for g in graphs)
+        return self._then('overlay', graphs, merge_fn, reverse)
+
+    def restrict(self, keys):
+        '''Keep only the root edges in keys, as in EdgeRestriction.'''
+        return self._then('restrict', frozenset(keys))
+
+    def sort(self):
+        '''Sort the keys of every node, as in SortedWrapper.'''
+        return self._then('sort')
+
+    def plan(self):
+        '''Return the steps as they'll be run, after optimization.
+
+        Root restrictions only filter keys, so they're moved back past every
+        step that doesn't change keys, and into the inputs of any overlay whose
+        merge_fn allows it, until they reach the source graph. Several
+        restrictions become one.
+        '''
+        steps = []
+        restriction = None
+        for step in reversed(self.steps):
+            kind = step[0]
+            if kind == 'restrict':
+                restriction = step[1] if restriction is None \
+                    else restriction & step[1]
+            elif kind == 'overlay' and restriction is not None:
+                _, graphs, merge_fn, reverse = step
+                if merge_fn in _DISTRIBUTIVE:
+                    graphs = tuple(EdgeRestriction(g, restriction)
+                        for g in graphs)
+                    steps.append(('overlay', graphs, merge_fn, reverse))
+                else:
+                    steps.append(('restrict', restriction))
+                    steps.append(step)
+                    restriction = None
+            else:
+                steps.append(step)
+        if restriction is not None:
+            steps.append(('restrict', restriction))
+        steps.reverse()
+        return steps
+
+    def lazy(self):
+        '''Return a virtual graph with the result of the pipeline.'''
+        graph = self.source
+        for step in self.plan():
+            kind = step[0]
+            if kind == 'map':
+                graph = MapWrapper(graph, fn=step[1])
+            elif kind == 'apply':
+                graph = AppliedGraphNode(graph, step[1])
+            elif kind == 'restrict':
+                graph = EdgeRestriction(graph, step[1])
+            elif kind == 'sort':
+                graph = SortedWrapper(graph)
+            else:
+                _, graphs, merge_fn, reverse = step
+                join_fn = 'overlay_reverse' if reverse else 'overlay'
+                graph = imerge(fuse(graph), *graphs, merge_fn=merge_fn,
+                    join_fn=join_fn)
+        return fuse(graph)
+
+    def materialize(self, cls=PlainGraphNode):
+        '''Run the pipeline, returning a new graph built in a single pass.'''
+        return plain_copy(self.lazy(), cls=cls)
+
+def pipeline(graph):
+    '''Start a chain of operations on graph, to be run in one pass.
+
+    Chaining eager functions like map() and overlay() copies the whole graph
+    at every step, while stacking their lazy versions slows down every access.
+    A pipeline records the operations instead, then runs them in one go:
+
+    >>> from .misc_fns import from_dict, dbg_print
+    >>> g = from_dict({'a': 1, 'b': None, 'c': {'d': 2}})
+    >>> defaults = from_dict({'b': 20, 'x': 30})
+    >>> p = (pipeline(g).fill_nones(0).map(lambda v: v + 1)
+    ...     .overlay(defaults, merge_fn='union').restrict(['a', 'b', 'x']))
+    >>> dbg_print(p.sort().materialize())
+    root: 1
+      +--a: 2
+      +--b: 1
+      +--x: 30
+
+    Before running, consecutive maps are fused into one function and root
+    restrictions are pushed down to the input graphs (see Pipeline.plan()), so
+    subtrees that are restricted away are never visited. lazy() returns the
+    result as a single fused virtual graph instead, and materialize(cls) copies
+    it into a graph of cls (default PlainGraphNode) in one traversal.
+    '''
+    return Pipeline(graph)
@@ -1,5 +1,6 @@
 from collections import OrderedDict
 import functools
+import pickle
 import sys
 
 if sys.version < '3': # pragma: no cover
@@ -8,7 +9,46 @@ else: # pragma: no cover
     text_type = str
     basestring = str
 
-from .graph import PlainGraphNode
+from .graph import FrozenGraph, PlainGraphNode
+
+class _WalkSignal(object):
+    __slots__ = ('result',)
+    def __init__(self, result=None):
+        self.result = result
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.result)
+
+class Prune(_WalkSignal):
+    '''Return Prune(result) from pre_children to skip a node's children.
+
+    The children won't be visited at all; post_children is still called for the
+    node itself, with an empty children dict and result as its pre_result.
+    '''
+    __slots__ = ()
+
+class Stop(_WalkSignal):
+    '''Return Stop(result) from pre_children or post_children to end a walk.
+
+    No further nodes are visited, and the walk returns result.
+    '''
+    __slots__ = ()
+
+class CycleError(ValueError):
+    '''Raised when a memoizing walk finds an edge back to an unfinished node.
+
+    The argument is the path of the offending edge.
+    '''
+
+class _Stopped(Exception):
+    # Carries a Stop out of the nested helpers of Walker.parallel_walk
+    pass
+
+ENTER = 'enter'
+LEAVE = 'leave'
+
+_NO_EDGES = iter(())
+_IN_PROGRESS = object()
 
 class Walker(object):
     '''Class to do depth-first walks of Graphs.
@@ -34,21 +74,150 @@ class Walker(object):
     The 'kwargs' arguments to walk() will be passed in to fn as fn(...,
     **kwargs).
 
-    Note that this function does NOT check for cycles. Walking a cyclic graph
-    will recurse infinitely.
+    Either function can end the walk early by returning Stop(result), in which
+    case the walk returns result without visiting any further nodes.
+    pre_children can also return Prune(pre_result) to skip the children of the
+    current node; see the docs for Prune and Stop.
+
+    The walk is iterative rather than recursive, so it works on graphs of any
+    depth. By default it does NOT check for cycles: walking a cyclic graph will
+    never terminate, and a node reachable along several paths will be visited
+    once per path.
+
+    Pass memoize=True to visit each node only once instead. The result for each
+    node is cached by identity, and any later edge to the same node reuses that
+    result without calling the visitors again, so the work done scales with the
+    number of distinct nodes rather than the number of paths. Edges that lead
+    back to a node still being walked raise a CycleError. Since each node is
+    visited only once, its visitors see just the first path that reaches it;
+    visitors whose results depend on the path should leave memoize off. Note
+    that the cache holds every node visited, so memoizing is only useful on
+    graphs whose nodes actually persist, like PlainGraphNodes, rather than
+    dynamic graphs that build new children on every access.
 
     You can also subclass Walker and override the visit_pre_children() and
     visit_post_children() methods, which by default are simply overridden by the
     two parameters.
 
     '''
-    def __init__(self, pre_children=None, post_children=None):
+    def __init__(self, pre_children=None, post_children=None, memoize=False):
         if pre_children:
             self.visit_pre_children = pre_children
         if post_children:
             self.visit_post_children = post_children
+        self.memoize = memoize
 
     def walk(self, node, path=(), args=(), kwargs=None):
+        node, path, kwargs = self._prepare(node, path, kwargs)
+        result = self._walk(node, path, args, kwargs)
+        if isinstance(result, Stop):
+            return result.result
+        return result
+
+    def parallel_walk(self, node, executor, split_depth=1, path=(), args=(),
+            kwargs=None):
+        '''Walk a graph, farming out subtrees to a concurrent.futures executor.
+
+        The nodes less than split_depth edges below the root are visited in this
+        process; each subtree rooted at depth split_depth is walked by a call to
+        executor.submit(). Results are combined exactly as walk() would combine
+        them, in the original edge order, so for visitors without side effects
+        parallel_walk(g, executor) returns the same thing as walk(g).
+
+        Both thread and process pools work. For a ProcessPoolExecutor, each
+        subtree is pickled together with this Walker and the walk args; any
+        subtree that can't be pickled is walked in this process instead. The
+        results returned by each subtree must be picklable, too.
+
+        Stop and Prune work as usual, except that subtrees already submitted
+        may run to completion, or stop on their own, before a Stop elsewhere is
+        noticed. With memoize=True, each subtree is memoized separately.
+
+        split_depth=0 submits the whole graph as a single walk; a negative
+        split_depth raises ValueError.
+        '''
+        from concurrent.futures import ProcessPoolExecutor
+        if split_depth < 0:
+            raise ValueError("split_depth must be at least 0, not {!r}"
+                .format(split_depth))
+        node, path, kwargs = self._prepare(node, path, kwargs)
+        use_pickle = isinstance(executor, ProcessPoolExecutor)
+        futures = []
+        def submit(child, child_path):
+            if use_pickle:
+                try:
+                    payload = pickle.dumps((self, child, child_path, args,
+                        kwargs), pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    return None
+                future = executor.submit(_walk_pickled, payload)
+            else:
+                future = executor.submit(self._walk, child, child_path, args,
+                    kwargs)
+            futures.append(future)
+            return future
+        try:
+            if split_depth == 0:
+                future = submit(node, path)
+                result = (self._walk(node, path, args, kwargs) if future is None
+                    else future.result())
+                return result.result if isinstance(result, Stop) else result
+            top = self._split(node, path, split_depth, args, kwargs, submit)
+            return self._join(top, args, kwargs)
+        except _Stopped as e:
+            return e.args[0].result
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _split(self, node, path, depth, args, kwargs, submit):
+        # First half of parallel_walk: run pre_children on the top of the graph
+        # and submit the subtrees below it. Returns a nested tuple (value, path,
+        # pre_result, subtrees), where subtrees is a list of (key, kind, item)
+        # and kind says whether item is a future, a node to walk locally, or
+        # another nested tuple.
+        pre_result = self.visit_pre_children(node.value, path, *args, **kwargs)
+        subtrees = []
+        if isinstance(pre_result, _WalkSignal):
+            if isinstance(pre_result, Stop):
+                raise _Stopped(pre_result)
+            pre_result = pre_result.result
+        else:
+            for key, child in node.edge_iter():
+                child_path = path + (key,)
+                if depth > 1:
+                    subtrees.append((key, 'split', self._split(child,
+                        child_path, depth-1, args, kwargs, submit)))
+                    continue
+                future = submit(child, child_path)
+                if future is None:
+                    subtrees.append((key, 'local', (child, child_path)))
+                else:
+                    subtrees.append((key, 'future', future))
+        return node.value, path, pre_result, subtrees
+
+    def _join(self, top, args, kwargs):
+        # Second half of parallel_walk: gather the subtree results and run
+        # post_children on the top of the graph.
+        value, path, pre_result, subtrees = top
+        children = OrderedDict()
+        for key, kind, item in subtrees:
+            if kind == 'split':
+                result = self._join(item, args, kwargs)
+            elif kind == 'local':
+                result = self._walk(item[0], item[1], args, kwargs)
+            else:
+                result = item.result()
+            if isinstance(result, Stop):
+                raise _Stopped(result)
+            children[key] = result
+        result = self.visit_post_children(value, path, children, pre_result,
+            *args, **kwargs)
+        if isinstance(result, Stop):
+            raise _Stopped(result)
+        return result
+
+    def _prepare(self, node, path, kwargs):
         if isinstance(node, dict):
             node = PlainGraphNode.build(node)
         if kwargs is None:
@@ -57,14 +226,73 @@ class Walker(object):
             path = (path,)
         if path is None:
             path = ()
-        return self._walk(node, path, args, kwargs)
+        return node, tuple(path), kwargs
 
     def _walk(self, node, path, args, kwargs):
-        pre_result = self.visit_pre_children(node.value, path, *args, **kwargs)
+        # Depth-first walk with an explicit stack instead of recursion, so that
+        # arbitrarily deep graphs don't hit the interpreter's recursion limit.
+        # The current path is kept as a list of keys; each visitor gets its own
+        # tuple copy, so memory stays linear in the depth of the graph. A leaf's
+        # post_children reuses the copy made for its pre_children.
+        # A Stop is returned as-is so that callers can tell it apart from an
+        # ordinary result.
+        # When memoizing, memo maps id(node) to (node, result), holding on to
+        # the node so that its id can't be reused; nodes still on the stack map
+        # to (node, _IN_PROGRESS).
+        pre = self.visit_pre_children
+        post = self.visit_post_children
+        memo = {} if self.memoize else None
+        keys = list(path)
+        value = node.value
+        node_path = path
+        pre_result = pre(value, path, *args, **kwargs)
+        if isinstance(pre_result, _WalkSignal):
+            if isinstance(pre_result, Stop):
+                return pre_result
+            edges = _NO_EDGES
+            pre_result = pre_result.result
+        else:
+            edges = iter(node.edge_iter())
+        if memo is not None:
+            memo[id(node)] = (node, _IN_PROGRESS)
         children = OrderedDict()
-        for key, child in node.edge_iter():
-            children[key] = self._walk(child, path+(key,), args, kwargs)
-        return self.visit_post_children(node.value, path, children, pre_result, *args, **kwargs)
+        stack = []
+        while True:
+            for key, child in edges:
+                if memo is not None:
+                    cached = memo.get(id(child))
+                    if cached is not None:
+                        if cached[1] is _IN_PROGRESS:
+                            raise CycleError(tuple(keys) + (key,))
+                        children[key] = cached[1]
+                        continue
+                    memo[id(child)] = (child, _IN_PROGRESS)
+                stack.append((node, value, edges, children, pre_result))
+                keys.append(key)
+                node = child
+                value = child.value
+                node_path = tuple(keys)
+                pre_result = pre(value, node_path, *args, **kwargs)
+                if isinstance(pre_result, _WalkSignal):
+                    if isinstance(pre_result, Stop):
+                        return pre_result
+                    edges = _NO_EDGES
+                    pre_result = pre_result.result
+                else:
+                    edges = iter(child.edge_iter())
+                children = OrderedDict()
+                break
+            else:
+                if node_path is None:
+                    node_path = tuple(keys)
+                result = post(value, node_path, children, pre_result, *args, **kwargs)
+                if not stack or isinstance(result, Stop):
+                    return result
+                if memo is not None:
+                    memo[id(node)] = (node, result)
+                node, value, edges, children, pre_result = stack.pop()
+                node_path = None
+                children[keys.pop()] = result
 
     def visit_post_children(self, value, path, children, pre_val, *args, **kwargs):
         return pre_val
@@ -77,36 +305,130 @@ class Walker(object):
         return self.walk(graph, path, args, kwargs)
 
 
-def walk(node, pre_children, post_children, path=None, args=(), kwargs=None):
+def iter_events(node, path=()):
+    '''Stream over a graph in depth-first order without building anything.
+
+    Yields ('enter', path, value) when the walk reaches a node and ('leave',
+    path, value) once all of that node's children have been visited. Only the
+    current path and one edge iterator per level are kept, so this works on
+    graphs of any size or depth, including dynamic graphs whose nodes are
+    generated as they're visited.
+
+    >>> g = PlainGraphNode.build(OrderedDict([
+    ...     ('_self', 'root'),
+    ...     ('a', OrderedDict([('_self', 'A'), ('b', 'B')])),
+    ...     ('c', 'C'),
+    ... ]))
+    >>> for event in iter_events(g):
+    ...     print(event)
+    ('enter', (), 'root')
+    ('enter', ('a',), 'A')
+    ('enter', ('a', 'b'), 'B')
+    ('leave', ('a', 'b'), 'B')
+    ('leave', ('a',), 'A')
+    ('enter', ('c',), 'C')
+    ('leave', ('c',), 'C')
+    ('leave', (), 'root')
+
+    Like walk(), this does not check for cycles.
+
+    On a FrozenGraph, the walk reads the store's arrays directly instead of
+    making a view for each node.
+    '''
+    if type(node) is FrozenGraph:
+        return _iter_frozen_events(node._store, node._index, path)
+    return _iter_events(node, path)
+
+def _iter_events(node, path):
+    keys = list(path)
+    value = node.value
+    yield ENTER, tuple(keys), value
+    edges = iter(node.edge_iter())
+    stack = []
+    while True:
+        for key, child in edges:
+            stack.append((value, edges))
+            keys.append(key)
+            value = child.value
+            yield ENTER, tuple(keys), value
+            edges = iter(child.edge_iter())
+            break
+        else:
+            yield LEAVE, tuple(keys), value
+            if not stack:
+                return
+            value, edges = stack.pop()
+            keys.pop()
+
+def _iter_frozen_events(store, index, path):
+    # The same walk as _iter_events, with each level's edge iterator replaced
+    # by the range of child indices still to visit.
+    offsets, key_ids, names, values = (store.offsets, store.key_ids,
+        store.keys, store.values)
+    keys = list(path)
+    value = values[index]
+    yield ENTER, tuple(keys), value
+    j, end = offsets[index], offsets[index+1]
+    stack = []
+    while True:
+        if j < end:
+            stack.append((value, j + 1, end))
+            keys.append(names[key_ids[j]])
+            value = values[j]
+            yield ENTER, tuple(keys), value
+            j, end = offsets[j], offsets[j+1]
+        else:
+            yield LEAVE, tuple(keys), value
+            if not stack:
+                return
+            value, j, end = stack.pop()
+            keys.pop()
+
+
+def _walk_pickled(payload):
+    # Runs in a worker process for Walker.parallel_walk
+    walker, node, path, args, kwargs = pickle.loads(payload)
+    return walker._walk(node, path, args, kwargs)
+
+
+def walk(node, pre_children, post_children, path=None, args=(), kwargs=None,
+    memoize=False):
     '''Walk a GraphNode, calling a function on each node.
 
     See the docs for Walker.
     '''
-    return Walker(pre_children, post_children).walk(node, path, args, kwargs)
+    walker = Walker(pre_children, post_children, memoize=memoize)
+    return walker.walk(node, path, args, kwargs)
+
+def _walker_decorator(fn, memoize, visitor):
+    if fn is None:
+        return functools.partial(_walker_decorator, memoize=memoize,
+            visitor=visitor)
+    w = Walker(memoize=memoize, **{visitor: fn})
+    @functools.wraps(fn)
+    def new_fn(graph, *args, **kwargs):
+        return w(graph, *args, **kwargs)
+    return new_fn
 
-def top_down(fn):
+def top_down(fn=None, memoize=False):
     '''Decorator that turns a function into a top-down walker.
 
     The function should have the pre_children signature described in the docs
     for Walker.
+
+    Use @top_down(memoize=True) to get a memoizing walker.
     '''
-    w = Walker(pre_children=fn)
-    @functools.wraps(fn)
-    def new_fn(graph, *args, **kwargs):
-        return w(graph, *args, **kwargs)
-    return new_fn
+    return _walker_decorator(fn, memoize, 'pre_children')
 
-def bottom_up(fn):
+def bottom_up(fn=None, memoize=False):
     '''Decorator that turns a function into a bottom-up walker.
 
     The function should have the post_children signature described in the docs
     for Walker.
+
+    Use @bottom_up(memoize=True) to get a memoizing walker.
     '''
-    w = Walker(post_children=fn)
-    @functools.wraps(fn)
-    def new_fn(graph, *args, **kwargs):
-        return w(graph, *args, **kwargs)
-    return new_fn
+    return _walker_decorator(fn, memoize, 'post_children')
 
 
 def test_walk():
@@ -185,14 +507,137 @@ def test_walk():
         ),
     )))
 
+    # Deep graphs don't hit the recursion limit
+    deep = PlainGraphNode(0)
+    for i in range(sys.getrecursionlimit() * 2):
+        deep = PlainGraphNode(i+1, child=deep)
+    assert walk(deep, None, count) == sys.getrecursionlimit() * 2 + 1
+    paths = []
+    walk(deep, lambda value, path: paths.append(path), None)
+    assert len(paths[-1]) == sys.getrecursionlimit() * 2
+    assert set(paths[-1]) == {'child'}
+
+def test_prune_and_stop():
+    tree = PlainGraphNode.build(OrderedDict([
+        ('_self', 0),
+        ('a', OrderedDict([
+            ('_self', 1),
+            ('x', 2),
+            ('y', 3),
+        ])),
+        ('b', OrderedDict([
+            ('_self', 4),
+            ('z', 5),
+        ])),
+    ]))
+    seen = []
+    def find(value, path, target):
+        seen.append(value)
+        if value == target:
+            return Stop(path)
+    assert walk(tree, find, None, kwargs=dict(target=3)) == ('a', 'y')
+    assert seen == [0, 1, 2, 3]
+    del seen[:]
+    assert walk(tree, find, None, kwargs=dict(target=17)) is None
+    assert seen == [0, 1, 2, 3, 4, 5]
+
+    def skip_a(value, path):
+        seen.append(value)
+        if path == ('a',):
+            return Prune('pruned')
+    del seen[:]
+    top_down(skip_a)(tree)
+    assert seen == [0, 1, 4, 5]
+
+    def pruned_count(value, path, children, pre):
+        if pre == 'pruned':
+            assert not children
+            return 0
+        return 1 + sum(children.values())
+    w = Walker(skip_a, pruned_count)
+    assert w(tree) == 3
+    assert w(tree, _root_path=('a',)) == 0
 
-'''
-Things to do:
-
-A loop-detecting walker that can wrap any other walker and stops it from being
-called on the same node twice.
-
-A hook for walkers to short-circuit (so that e.g. a comparison walker can stop
-as soon as it finds anything that doesn't match)
-
-'''
+    @bottom_up
+    def first_odd_leaf(value, path, children, _pre):
+        if not children and value % 2:
+            return Stop(path)
+    assert first_odd_leaf(tree) == ('a', 'y')
+    assert walk(tree, lambda value, path: Stop('root'), None) == 'root'
+
+def test_children_are_fresh():
+    # Every node gets its own children dict, which visitors may modify
+    def with_self(value, path, children, _pre):
+        children['_self'] = value
+        return children
+    g = PlainGraphNode(0, a=PlainGraphNode(1), b=PlainGraphNode(2))
+    assert walk(g, None, with_self) == {
+        'a': {'_self': 1}, 'b': {'_self': 2}, '_self': 0}
+
+def test_memoize():
+    # A chain of diamonds has 2**n paths but only 3n+1 distinct nodes
+    g = PlainGraphNode('bottom')
+    for i in range(40):
+        g = PlainGraphNode(i, left=PlainGraphNode('l', x=g),
+            right=PlainGraphNode('r', x=g))
+    calls = []
+    def count_paths(value, path, children, _pre):
+        calls.append(path)
+        return sum(children.values()) or 1
+    assert walk(g, None, count_paths, memoize=True) == 2**40
+    assert len(calls) == 3*40 + 1
+    # The first path to reach each node is the one the visitors see
+    assert calls[0] == ('left', 'x')*40
+
+    @bottom_up(memoize=True)
+    def count_nodes(value, path, children, _pre):
+        return 1 + sum(children.values())
+    small = PlainGraphNode(0, a=PlainGraphNode(1))
+    assert count_nodes(PlainGraphNode(2, b=small, c=small)) == 5
+
+    @top_down(memoize=True)
+    def collect(value, path, out):
+        out.append(value)
+    out = []
+    collect(PlainGraphNode(2, b=small, c=small), out)
+    assert out == [2, 0, 1]
+
+    loop = PlainGraphNode('loop')
+    loop.add_edge('a', PlainGraphNode('a', back=loop))
+    try:
+        walk(loop, None, count_paths, memoize=True)
+    except CycleError as e:
+        assert e.args == (('a', 'back'),)
+    else: # pragma: no cover
+        raise Exception("Expected a CycleError")
+
+def test_iter_events():
+    from .graph import JsonGraphNode
+    from .zip_fns import izip
+    data = {'a': [1, {'b': 2}], 'c': 3}
+    events = list(iter_events(JsonGraphNode(data)))
+    assert [e[:2] for e in events if e[0] == ENTER] == [
+        (ENTER, path) for path in sorted(
+            [(), ('a',), ('a', '0'), ('a', '1'), ('a', '1', 'b'), ('c',)])]
+    assert len(events) == 12
+    assert events[-1] == (LEAVE, (), data)
+    # Streams over lazy graphs, and starts from an optional path prefix
+    g = PlainGraphNode.build(dict(x=1, y=dict(z=2)))
+    events = list(iter_events(izip(g, g), path=('root',)))
+    assert events[0] == (ENTER, ('root',), (None, None))
+    assert (ENTER, ('root', 'y', 'z'), (2, 2)) in events
+    # Deep graphs work, too
+    deep = PlainGraphNode(0)
+    for i in range(sys.getrecursionlimit() * 2):
+        deep = PlainGraphNode(i+1, child=deep)
+    assert sum(1 for e in iter_events(deep)) == 2 * (sys.getrecursionlimit() * 2 + 1)
+    # Frozen graphs, and nodes within them, give the same events
+    from .graph import freeze
+    g = PlainGraphNode.build(OrderedDict([('_self', 0), ('a', OrderedDict([
+        ('_self', 1), ('b', 2), ('c', OrderedDict([('d', 3)]))])), ('e', 4)]))
+    f = freeze(g)
+    assert list(iter_events(f)) == list(iter_events(g))
+    assert (list(iter_events(f['a'], path=('a',))) ==
+        list(iter_events(g['a'], path=('a',))))
+    assert list(iter_events(f['e'])) == [(ENTER, (), 4), (LEAVE, (), 4)]
+    assert sum(1 for e in iter_events(freeze(deep))) == 2 * (sys.getrecursionlimit() * 2 + 1)
@@ -1,4 +1,9 @@
-from .graph import GraphNode
+from collections import OrderedDict, namedtuple
+
+from .graph import GraphNode, Missing
+
+# GraphWrapper._all_slots() results, by class
+_all_slots_cache = {}
 
 class GraphWrapper(GraphNode):
     '''Virtual graph that wraps an existing graph.
@@ -63,7 +68,11 @@ class GraphWrapper(GraphNode):
 
     @classmethod
     def _all_slots(cls):
-        return set(sum((getattr(c, '__slots__', ()) for c in cls.__mro__), ()))
+        slots = _all_slots_cache.get(cls)
+        if slots is None:
+            slots = _all_slots_cache[cls] = frozenset(
+                sum((getattr(c, '__slots__', ()) for c in cls.__mro__), ()))
+        return slots
 
 class MapWrapper(GraphWrapper):
     '''GraphWrapper that filters values through a function.
@@ -236,3 +245,248 @@ class EdgeRestriction(GraphWrapper):
         if key in self.edge_names:
             return self.graph[key]
         raise KeyError(key)
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+class _ChildCache(object):
+    # Shared by every node of one CachingWrapper graph: the most recently used
+    # child nodes, by path, and the hit and miss counts.
+    __slots__ = ('nodes', 'maxsize', 'hits', 'misses')
+    def __init__(self, maxsize):
+        self.nodes = OrderedDict()
+        # As with functools.lru_cache, a negative maxsize means 0
+        self.maxsize = maxsize if maxsize is None else max(maxsize, 0)
+        self.hits = self.misses = 0
+
+class CachingWrapper(GraphWrapper):
+    '''Wrapper that remembers the nodes and values of a dynamic graph.
+
+    Dynamic graphs like GraphWrappers, zipped graphs and JsonGraphNodes create
+    their children afresh each time they're requested. CachingWrapper(g) keeps
+    the most recently used maxsize (default 1024) of its nodes, along with each
+    node's value and keys, so traversing it again costs about as much as
+    traversing a plain graph, but without copying all of it like plain_copy():
+
+    >>> from .graph import PlainGraphNode
+    >>> calls = []
+    >>> def double(value):
+    ...     calls.append(value)
+    ...     return value * 2
+    >>> g = MapWrapper(PlainGraphNode(1, a=PlainGraphNode(2)), fn=double)
+    >>> cg = CachingWrapper(g, maxsize=100)
+    >>> cg['a'] is cg['a']
+    True
+    >>> cg['a'].value, cg['a'].value
+    (4, 4)
+    >>> calls
+    [2]
+    >>> cg.cache_info()
+    CacheInfo(hits=3, misses=1, maxsize=100, currsize=1)
+
+    maxsize=None lets the cache grow without limit, and maxsize=0 turns off
+    caching of child nodes, though each node still remembers its own value and
+    keys. Nodes are cached by path, so a node reached by two different paths is
+    cached twice.
+
+    The wrapped graph is assumed not to change. If it does, call cache_clear()
+    and start again from a fresh CachingWrapper, since nodes you already hold
+    keep their cached values.
+    '''
+    __slots__ = ('_cache', '_path', '_value', '_keys')
+    def __init__(self, graph, maxsize=1024, _cache=None, _path=()):
+        self.graph = graph
+        self._cache = _ChildCache(maxsize) if _cache is None else _cache
+        self._path = _path
+        self._value = self._keys = Missing
+
+    @property
+    def value(self):
+        if self._value is Missing:
+            self._value = self.graph.value
+        return self._value
+
+    def key_iter(self):
+        if self._keys is Missing:
+            self._keys = tuple(self.graph.key_iter())
+        return self._keys
+
+    def _get_child(self, key):
+        cache = self._cache
+        nodes = cache.nodes
+        path = self._path + (key,)
+        child = nodes.pop(path, None)
+        if child is not None:
+            cache.hits += 1
+        else:
+            cache.misses += 1
+            child = CachingWrapper(self.graph.get_child(key), _cache=cache,
+                _path=path)
+            if cache.maxsize == 0:
+                return child
+            if cache.maxsize is not None and len(nodes) >= cache.maxsize:
+                nodes.popitem(last=False)
+        # (Re)inserting marks this as the most recently used node
+        nodes[path] = child
+        return child
+
+    def cache_info(self):
+        '''Return the hits, misses, maxsize and current size of the cache.'''
+        cache = self._cache
+        return CacheInfo(cache.hits, cache.misses, cache.maxsize,
+            len(cache.nodes))
+
+    def cache_clear(self):
+        '''Empty the cache and reset its counters.'''
+        cache = self._cache
+        cache.nodes.clear()
+        cache.hits = cache.misses = 0
+
+
+def _compose(fns):
+    if len(fns) == 1:
+        return fns[0]
+    def composed(value):
+        for fn in fns:
+            value = fn(value)
+        return value
+    return composed
+
+class FusedWrapper(GraphWrapper):
+    '''A single wrapper doing the work of a stack of simple wrappers.
+
+    Use fuse() to build one. ops lists the value transformations from the
+    innermost out, as (kind, arg) pairs:
+
+    - ('map', fn): fn is applied to the value at every node, as in MapWrapper
+    - ('apply', fn_graph): as in AppliedGraphNode, the matching node of fn_graph
+      holds a function for this node's value (or None); children get the
+      matching children of fn_graph, and nodes without one drop this op
+    - ('value', value): replaces the root value only, as in ValueOverlay
+
+    edge_names, if not None, restricts the root's edges as in EdgeRestriction,
+    and sort sorts the keys of every node as in SortedWrapper. Adjacent maps are
+    composed into one function.
+    '''
+    __slots__ = ('ops', 'edge_names', 'sort', '_start')
+    def __init__(self, graph, ops=(), edge_names=None, sort=False):
+        self.graph = graph
+        merged = []
+        for kind, arg in ops:
+            if kind == 'map' and merged and merged[-1][0] == 'map':
+                merged[-1] = ('map', merged[-1][1] + (arg,))
+            else:
+                merged.append((kind, (arg,) if kind == 'map' else arg))
+        self.ops = tuple((kind, _compose(arg)) if kind == 'map' else (kind, arg)
+            for kind, arg in merged)
+        self.edge_names = edge_names
+        self.sort = sort
+        # Anything before the last ValueOverlay doesn't affect the root's value
+        self._start = max([-1] + [i for i, (kind, _) in enumerate(self.ops)
+            if kind == 'value'])
+
+    @property
+    def value(self):
+        ops = self.ops
+        if self._start == -1:
+            value = self.graph.value
+        else:
+            value = ops[self._start][1]
+        for kind, arg in ops[self._start+1:]:
+            if kind == 'map':
+                value = arg(value)
+            else:
+                fn = arg.value
+                if fn is not None:
+                    value = fn(value)
+        return value
+
+    def key_iter(self):
+        keys = self.graph.key_iter()
+        if self.edge_names is not None:
+            keys = [key for key in keys if key in self.edge_names]
+        if self.sort:
+            keys = sorted(keys)
+        return keys
+
+    def _get_child(self, key):
+        if self.edge_names is not None and key not in self.edge_names:
+            raise KeyError(key)
+        child = self.graph[key]
+        ops = []
+        for op in self.ops:
+            kind, arg = op
+            if kind == 'map':
+                ops.append(op)
+            elif kind == 'apply':
+                fn_child = arg.get_child(key, None)
+                if fn_child is not None:
+                    ops.append(('apply', fn_child))
+        if not ops and not self.sort:
+            return child
+        return FusedWrapper(child, ops, sort=self.sort)
+
+def fuse(graph):
+    '''Collapse a stack of lazy views into a single FusedWrapper.
+
+    Every access to a node of imap(imap(EdgeRestriction(SortedWrapper(g))))
+    goes through each layer in turn, creating one wrapper per layer for every
+    child. fuse() peels off any MapWrapper, SortedWrapper, EdgeRestriction,
+    ValueOverlay, AppliedGraphNode and FusedWrapper layers on top of graph and
+    returns one wrapper over the graph underneath with the same values and
+    structure:
+
+    >>> from .graph import PlainGraphNode as G
+    >>> from .misc_fns import imap
+    >>> g = G(1, [('b', G(2)), ('a', G(3)), ('c', G(4))])
+    >>> stacked = imap(imap(EdgeRestriction(SortedWrapper(g), {'a', 'b'}),
+    ...     lambda v: v + 1), lambda v: v * 10)
+    >>> fused = fuse(stacked)
+    >>> fused.all_equals(stacked)
+    True
+    >>> list(fused.key_iter()), fused['a'].value
+    (['a', 'b'], 40)
+    >>> fused.graph is g
+    True
+
+    Consecutive maps become one composed function, all the edge restrictions
+    become one set, and any number of SortedWrappers become one sort, so the
+    cost per access barely grows with the number of layers. Other layers
+    (and subclasses of these) are left as they are, and fusion stops at the
+    first one. A graph with nothing to fuse is returned unchanged.
+    '''
+    from .misc_fns import AppliedGraphNode
+    ops = []
+    edge_names = None
+    sort = False
+    while True:
+        kind = type(graph)
+        if kind is MapWrapper:
+            ops.append(('map', graph.fn))
+            graph = graph.graph
+        elif kind is SortedWrapper:
+            sort = True
+            graph = graph.graph
+        elif kind is EdgeRestriction:
+            names = frozenset(graph.edge_names)
+            edge_names = names if edge_names is None else edge_names & names
+            graph = graph.graph
+        elif kind is ValueOverlay:
+            ops.append(('value', graph._value))
+            graph = graph.graph
+        elif kind is AppliedGraphNode:
+            ops.append(('apply', graph.fn_graph))
+            graph = graph.source_graph
+        elif kind is FusedWrapper:
+            # Its composed maps are kept as they are
+            ops.extend(reversed(graph.ops))
+            if graph.edge_names is not None:
+                edge_names = graph.edge_names if edge_names is None \
+                    else edge_names & graph.edge_names
+            sort = sort or graph.sort
+            graph = graph.graph
+        else:
+            break
+    if not ops and edge_names is None and not sort:
+        return graph
+    return FusedWrapper(graph, reversed(ops), edge_names, sort)
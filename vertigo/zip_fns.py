@@ -9,57 +9,125 @@ else: # pragma: no cover
     basestring = str
 
 from .graph import GraphNode, plain_copy, PlainGraphNode
-from .walker import bottom_up
+from .graph import PersistentGraphNode, FrozenGraph
+from .walker import Walker
 
 class StructureMismatch(Exception):
     pass
 
+# Graph types whose key_iter lists every key they have, so that a key missing
+# from the list is missing from the graph. Others, like StarGraphNode, may
+# have children they don't list, which only `key in graph` can find.
+_CLOSED_TYPES = frozenset([PlainGraphNode, PersistentGraphNode, FrozenGraph])
+
+# Graph types that can't change once built, so that their key lists can be
+# kept between calls to key_iter.
+_IMMUTABLE_TYPES = frozenset([PersistentGraphNode, FrozenGraph])
+
+def _key_table(graph, keys):
+    '''Return something to look up graph's children in without exceptions.
+
+    That's the edge dict itself for plain and persistent nodes, a set of keys
+    for other closed graphs, and None if only graph.get_child will do.
+    '''
+    kind = type(graph)
+    if kind is PlainGraphNode or kind is PersistentGraphNode:
+        return graph._edges
+    if kind in _CLOSED_TYPES:
+        return set(keys)
+    return None
+
 def _non_none(graphs):
     return [n for n in graphs if n is not None]
 
-def union(graphs):
-    '''Iterate over all keys of all graphs, skipping duplicates.'''
-    keys = itertools.chain(*[g.key_iter() for g in _non_none(graphs)])
-    used = set()
-    for key in keys:
-        if key not in used:
-            used.add(key)
-            yield key
-
-def intersection(graphs):
-    '''Iterate over only keys that are in all graphs.'''
-    graphs = _non_none(graphs)
-    for key in union(graphs):
-        for graph in graphs:
-            if key not in graph:
-                break
-        else:
-            yield key
-
-def first(graphs):
-    '''Iterate over the first graph's keys and no others.'''
-    if graphs and graphs[0]:
-        for key in graphs[0].key_iter():
-            yield key
-
-def last(graphs):
-    '''Iterate over the last graph's keys and no others.'''
-    if graphs and graphs[-1]:
-        for key in graphs[-1].key_iter():
-            print(key)
-            yield key
-
-def strict(graphs):
-    '''Raise StructureMismatch unless all graphs have the same keys.'''
-    return list(_strict(graphs))
+def with_key_lists(fn):
+    '''Mark a merge_fn as taking the graphs' keys as well as the graphs.
 
-def _strict(graphs):
-    for key in union(graphs):
-        for graph in graphs:
-            if key not in graph:
-                raise StructureMismatch(key)
+    ZippedGraphNode calls a marked merge_fn as fn(graphs, key_lists), where
+    key_lists[i] is list(graphs[i].key_iter()), or None if graphs[i] is None.
+    If every input graph is immutable, the lists are gathered once per zipped
+    node and also used to skip looking up children that a graph doesn't have;
+    otherwise they're gathered on each call, so that changes to the inputs
+    show up. All the built-in merge_fns are
+    marked; when called directly, they gather the lists themselves.
+    '''
+    fn.with_key_lists = True
+    return fn
+
+def _key_lists(graphs):
+    return [None if g is None else list(g.key_iter()) for g in graphs]
+
+def _membership(graphs, key_lists):
+    '''Return a test for whether a key is in every non-None graph.'''
+    closed, open_graphs = [], []
+    for i, graph in enumerate(graphs):
+        if graph is None:
+            continue
+        keys = set(key_lists[i])
+        if type(graph) in _CLOSED_TYPES:
+            closed.append(keys)
         else:
-            yield key
+            open_graphs.append((graph, keys))
+    def has_key(key):
+        for keys in closed:
+            if key not in keys:
+                return False
+        for graph, keys in open_graphs:
+            if key not in keys and key not in graph:
+                return False
+        return True
+    return has_key
+
+@with_key_lists
+def union(graphs, key_lists=None):
+    '''List all keys of all graphs, skipping duplicates.'''
+    if key_lists is None:
+        key_lists = _key_lists(graphs)
+    return list(OrderedDict.fromkeys(itertools.chain.from_iterable(
+        keys for keys in key_lists if keys is not None)))
+
+@with_key_lists
+def intersection(graphs, key_lists=None):
+    '''List only keys that are in all graphs.'''
+    if key_lists is None:
+        key_lists = _key_lists(graphs)
+    keys = union(graphs, key_lists)
+    if not keys:
+        return keys
+    has_key = _membership(graphs, key_lists)
+    return [key for key in keys if has_key(key)]
+
+@with_key_lists
+def first(graphs, key_lists=None):
+    '''List the first graph's keys and no others.'''
+    if not graphs or graphs[0] is None:
+        return []
+    if key_lists is None:
+        return list(graphs[0].key_iter())
+    return key_lists[0]
+
+@with_key_lists
+def last(graphs, key_lists=None):
+    '''List the last graph's keys and no others.'''
+    if not graphs or graphs[-1] is None:
+        return []
+    if key_lists is None:
+        return list(graphs[-1].key_iter())
+    return key_lists[-1]
+
+@with_key_lists
+def strict(graphs, key_lists=None):
+    '''Raise StructureMismatch unless all graphs have the same keys.'''
+    if key_lists is None:
+        key_lists = _key_lists(graphs)
+    keys = union(graphs, key_lists)
+    if not keys:
+        return keys
+    has_key = _membership(graphs, key_lists)
+    for key in keys:
+        if not has_key(key):
+            raise StructureMismatch(key)
+    return keys
 
 def get_key_fn(name):
     # if name == 'strict':
@@ -95,6 +163,10 @@ class ZippedGraphNode(GraphNode):
     'strict' - a StructureMismatch() will be raised unless all graphs have the
             same set of edges.
 
+    A custom merge_fn decorated with with_key_lists() is also passed each
+    graph's list of keys, which are gathered only once per node when all the
+    input graphs are immutable.
+
     The argument default determines what value will appear at nodes where some
     graphs don't exist. For example, if the merge_fn is union and the first
     graph has g1['foo'].value == 1, but second graph doesn't contain the edge
@@ -111,6 +183,12 @@ class ZippedGraphNode(GraphNode):
             merge_fn = get_key_fn(merge_fn)
         self.default = default
         self.merge_fn = merge_fn
+        # Filled in by key_iter() if merge_fn takes key lists and every input
+        # is immutable, and then used by _get_child() to find children without
+        # raising KeyErrors. Mutable inputs are re-read on every call, so the
+        # zipped view follows changes to them.
+        self._key_lists = None
+        self._key_sets = None
 
     def _build_child(self, graphs):
         return type(self)(graphs, merge_fn=self.merge_fn, default=self.default)
@@ -120,12 +198,45 @@ class ZippedGraphNode(GraphNode):
         return tuple(g.value if g else self.default for g in self.graphs)
 
     def key_iter(self):
+        if getattr(self.merge_fn, 'with_key_lists', False):
+            if self._key_lists is not None:
+                return self.merge_fn(self.graphs, self._key_lists)
+            key_lists = _key_lists(self.graphs)
+            if all(type(n) in _IMMUTABLE_TYPES for n in _non_none(self.graphs)):
+                self._key_lists = key_lists
+            return self.merge_fn(self.graphs, key_lists)
         return self.merge_fn(self.graphs)
 
     def _get_child(self, key):
-        graphs = [(n.get_child(key, None) if n else None) for n in self.graphs]
+        if self._key_lists is None:
+            graphs = [_lookup(n, key) for n in self.graphs]
+        else:
+            if self._key_sets is None:
+                self._key_sets = [_key_table(n, self._key_lists[i])
+                    for i, n in enumerate(self.graphs)]
+            graphs = []
+            for i, n in enumerate(self.graphs):
+                keys = self._key_sets[i]
+                if n is None:
+                    graphs.append(None)
+                elif isinstance(keys, dict):
+                    graphs.append(keys.get(key))
+                elif keys is not None and key not in keys:
+                    graphs.append(None)
+                else:
+                    graphs.append(n.get_child(key, None))
+        if self.graphs and all(n is None for n in graphs):
+            raise KeyError(key)
         return self._build_child(graphs)
 
+def _lookup(graph, key):
+    if graph is None:
+        return None
+    kind = type(graph)
+    if kind is PlainGraphNode or kind is PersistentGraphNode:
+        return graph._edges.get(key)
+    return graph.get_child(key, None)
+
 
 def izip(*graphs, **kwargs):
     '''Return a ZippedGraphNode wrapping the input graphs.
@@ -152,8 +263,23 @@ def zip(*graphs, **kwargs):
     return plain_copy(izip(*graphs, **kwargs), cls)
 
 
-@bottom_up
-def unzip(values, _path, children, _pre, cls=PlainGraphNode):
+def _unzip_node(values, _path, children, _pre, cls=PlainGraphNode):
+    trees = []
+    for i in range(len(values)):
+        kids = OrderedDict()
+        for key in children:
+            kids[key] = children[key][i]
+        trees.append(cls(values[i], kids))
+    return tuple(trees)
+
+_unzip_walker = Walker(post_children=_unzip_node)
+_unzip_memo_walker = Walker(post_children=_unzip_node, memoize=True)
+
+# Graph types whose nodes are the same objects each time they're reached, so
+# that memoizing a walk over them can pay off.
+_STABLE_TYPES = frozenset([PlainGraphNode, PersistentGraphNode])
+
+def unzip(graph, cls=PlainGraphNode):
     '''Unzip a zipped graph node.
 
     The input graph should be a zipped graph, that is, a graph whose values are
@@ -164,12 +290,12 @@ def unzip(values, _path, children, _pre, cls=PlainGraphNode):
 
     For other merge_fns, zip may drop nodes or add empty nodes, so they will not
     be perfect opposites.
-    '''
-    trees = []
-    for i in range(len(values)):
-        kids = OrderedDict()
-        for key in children:
-            kids[key] = children[key][i]
-        trees.append(cls(values[i], kids))
-    return tuple(trees)
 
+    If graph is a PlainGraphNode or PersistentGraphNode, nodes that appear more
+    than once in it are only unzipped once, and the corresponding output nodes
+    are shared in the same way. Dynamic graphs like izip() build new children
+    on every access, so for them every node is unzipped separately.
+    '''
+    if type(graph) in _STABLE_TYPES:
+        return _unzip_memo_walker(graph, cls=cls)
+    return _unzip_walker(graph, cls=cls)